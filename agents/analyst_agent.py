@@ -54,12 +54,13 @@
 
         
 from typing import List, Dict
-from openai import AzureOpenAI
 import logging
-import json
 import time
 import os
 from dotenv import load_dotenv
+from agents.context_packer import pack_context
+from utils import resilience
+from utils.registry import get_openai_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -68,11 +69,7 @@ load_dotenv()
 class AnalystAgent:
     def __init__(self):
         try:
-            self.client = AzureOpenAI(
-                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                api_version="2024-02-01"
-            )
+            self.client = get_openai_client()
             self.deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
             if not self.deployment:
                 raise ValueError("AZURE_OPENAI_DEPLOYMENT not set")
@@ -86,28 +83,21 @@ class AnalystAgent:
             logger.warning(f"No papers found for query: {query}")
             return {"summary": f"No papers found for query: {query}"}
 
-        analysis_input = []
-        for paper in papers[:3]:
-            try:
-                if not paper.get("content"):
-                    logger.warning(f"Skipping paper with missing content: {paper.get('title', 'Untitled')}")
-                    continue
-                analysis_input.append({
-                    "title": paper.get("title", "Untitled Paper"),
-                    "key_content": paper.get("content", "")[:1000]
-                })
-            except Exception as e:
-                logger.error(f"Skipping paper due to error: {str(e)}")
-                continue
-
+        # Best evidence first, trimmed at sentence boundaries to the configured token budget
+        analysis_input, packing = pack_context(papers)
         if not analysis_input:
             logger.warning("No valid papers to analyze after filtering")
             return {"summary": "No valid papers to analyze"}
 
         try:
-            logger.info(f"Analyzing {len(analysis_input)} papers for query: {query}")
+            logger.info(
+                f"Analyzing {packing['papers']} of {packing['candidates']} papers "
+                f"({packing['tokens']}/{packing['budget']} tokens, {packing['trimmed']} trimmed) for query: {query}"
+            )
             start = time.time()
-            response = self.client.chat.completions.create(
+            response = resilience.call(
+                f"azure-chat:{self.deployment}",
+                self.client.chat.completions.create,
                 model=self.deployment,
                 messages=[
                     {
@@ -116,7 +106,7 @@ class AnalystAgent:
                     },
                     {
                         "role": "user",
-                        "content": f"Query: {query}\n\nPapers:\n{json.dumps(analysis_input, indent=2)}"
+                        "content": f"Query: {query}\n\nPapers:\n{analysis_input}"
                     }
                 ],
                 temperature=0.3,
@@ -124,6 +114,9 @@ class AnalystAgent:
             )
             logger.info(f"GPT-4o call took {time.time() - start} seconds")
             return {"summary": response.choices[0].message.content}
+        except resilience.CircuitOpenError as e:
+            logger.error(f"Analysis skipped: {str(e)}")
+            return {"summary": f"Analysis unavailable: {str(e)}"}
         except Exception as e:
             logger.error(f"Analysis failed: {str(e)}")
             return {"summary": f"Analysis error: {str(e)}"}
\ No newline at end of file
@@ -0,0 +1,138 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from config import SearchConfig
+from utils.registry import shared
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class CachedResults:
+    """A cached arXiv result list for one normalized (query, sort) key."""
+
+    def __init__(self, papers: List[Dict], fetched_at: float, exhausted: bool):
+        self.papers = papers
+        self.fetched_at = fetched_at
+        self.exhausted = exhausted  # arXiv had no more results past these
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def covers(self, max_results: int) -> bool:
+        return self.exhausted or len(self.papers) >= max_results
+
+
+class ArxivResultCache:
+    """TTL cache of normalized arXiv results, persisted in SQLite.
+
+    Entries are keyed by the normalized query and sort criterion and hold the
+    longest prefix of results fetched so far, so a request for more results
+    than are cached only needs to fetch the remainder.
+    """
+
+    def __init__(
+        self,
+        path: str = SearchConfig.CACHE_PATH,
+        ttl_seconds: float = SearchConfig.CACHE_TTL_SECONDS,
+        max_entries: int = SearchConfig.CACHE_MAX_ENTRIES,
+        serve_stale: bool = SearchConfig.CACHE_SERVE_STALE
+    ):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.serve_stale = serve_stale
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, papers TEXT NOT NULL, fetched_at REAL NOT NULL, exhausted INTEGER NOT NULL)"
+        )
+        self._db.commit()
+        self.hits = 0
+        self.partial_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, sort_by: str) -> str:
+        return f"{sort_by}\x00{' '.join(query.lower().split())}"
+
+    def lookup(self, key: str, max_results: int) -> Tuple[str, Optional[CachedResults]]:
+        """Classify a request and count it.
+
+        Returns ``("hit", entry)`` when a fresh entry covers ``max_results``,
+        ``("partial", entry)`` when a fresh entry only holds a prefix,
+        ``("stale", entry)`` when an expired entry may be served while it is
+        refreshed, and ``("miss", None)`` otherwise.
+        """
+        entry = self.get(key)
+        if entry is not None and self.is_fresh(entry):
+            if entry.covers(max_results):
+                self.hits += 1
+                return "hit", entry
+            self.partial_hits += 1
+            return "partial", entry
+        if entry is not None and self.serve_stale and entry.covers(max_results):
+            self.stale_hits += 1
+            return "stale", entry
+        self.misses += 1
+        return "miss", None
+
+    def get(self, key: str) -> Optional[CachedResults]:
+        """Return the entry for ``key`` (fresh or stale), or ``None``."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT papers, fetched_at, exhausted FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return CachedResults(json.loads(row[0]), row[1], bool(row[2]))
+
+    def is_fresh(self, entry: CachedResults) -> bool:
+        return entry.age() < self.ttl_seconds
+
+    def put(self, key: str, papers: List[Dict], exhausted: bool, fetched_at: Optional[float] = None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, papers, fetched_at, exhausted) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(papers), fetched_at or time.time(), int(exhausted))
+            )
+            # Drop the oldest entries beyond the size cap
+            self._db.execute(
+                "DELETE FROM results WHERE key NOT IN "
+                "(SELECT key FROM results ORDER BY fetched_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def start_refresh(self, key: str) -> bool:
+        """Claim the background refresh for ``key``; False if one is already running."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def finish_refresh(self, key: str):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "partial_hits": self.partial_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses
+        }
+
+
+def get_arxiv_cache() -> ArxivResultCache:
+    """Return the process-wide arXiv result cache."""
+    return shared("arxiv-cache", ArxivResultCache)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import re
+from typing import Dict, List, Tuple
+
+from config import AnalystConfig
+from rag import chunking
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+CHARS_PER_TOKEN = 4  # Rough English average, used when the tokenizer is unavailable
+_encoding_failed = False
+
+
+def count_tokens(text: str) -> int:
+    """Token count of ``text``, estimated from its length if tiktoken cannot
+    load its encoding (it downloads it on first use)."""
+    global _encoding_failed
+    if not _encoding_failed:
+        try:
+            return chunking.count_tokens(text)
+        except Exception as e:
+            logger.warning(f"Tokenizer unavailable, estimating context tokens from length: {str(e)}")
+            _encoding_failed = True
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if not _encoding_failed:
+        try:
+            return chunking.truncate_tokens(text, max_tokens)
+        except Exception:
+            count_tokens(text)  # Logs once and switches to the estimate
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+def compact_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def pack_context(papers: List[Dict], budget: int = AnalystConfig.CONTEXT_TOKENS,
+                 max_paper_tokens: int = AnalystConfig.MAX_PAPER_TOKENS,
+                 min_paper_tokens: int = AnalystConfig.MIN_PAPER_TOKENS) -> Tuple[str, Dict]:
+    """Serialize the most valuable papers into at most ``budget`` tokens.
+
+    Papers are taken in order of ``relevance_score`` when any carries one,
+    else in the given (retrieval) order, and each contributes its
+    ``summary`` when present, else its ``content``. Greedily, each paper
+    gets whole sentences up to ``max_paper_tokens`` or the remaining budget;
+    one that cannot fit ``min_paper_tokens`` is skipped. Returns a compact
+    JSON array and a report of what was packed.
+    """
+    candidates, seen = [], set()
+    for rank, paper in enumerate(papers):
+        if not isinstance(paper, dict):
+            continue
+        text = str(paper.get("summary") or paper.get("content") or "").strip()
+        # Papers without any identifier are told apart by their text
+        key = paper.get("source") or paper.get("url") or paper.get("title") or hashlib.sha256(
+            text.encode("utf-8")
+        ).hexdigest()
+        if not text or key in seen:
+            continue
+        seen.add(key)
+        candidates.append((rank, paper, text))
+    if any(isinstance(paper.get("relevance_score"), (int, float)) for _, paper, _ in candidates):
+        candidates.sort(key=lambda item: (-float(item[1].get("relevance_score") or 0.0), item[0]))
+
+    packed, used, trimmed = [], 2, 0  # The enclosing brackets
+    for _, paper, text in candidates:
+        title = str(paper.get("title") or "Untitled Paper")
+        overhead = count_tokens(compact_json({"title": title, "content": ""})) + 1  # Separating comma
+        limit = min(max_paper_tokens, budget - used)
+        allowance = limit - overhead
+        item = None
+        # JSON escaping and token merges at the seams can make the serialized
+        # item longer than its parts, so measure it and trim again until it fits
+        while allowance >= min_paper_tokens:
+            content, cut = _fit_sentences(text, allowance)
+            if not content:
+                break
+            candidate = compact_json({"title": title, "content": content})
+            excess = count_tokens(candidate) + 1 - limit
+            if excess <= 0:
+                item = candidate
+                break
+            allowance -= excess
+        if item is None:
+            continue
+        packed.append(item)
+        used += count_tokens(item) + 1
+        trimmed += cut
+    context = f"[{','.join(packed)}]" if packed else ""
+    report = {"papers": len(packed), "candidates": len(candidates), "trimmed": trimmed,
+              "tokens": count_tokens(context) if packed else 0, "budget": budget}
+    return context, report
+
+
+def _fit_sentences(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """Leading whole sentences of ``text`` within ``max_tokens`` (a token cut
+    of the first one if even that is too long), and whether anything was cut."""
+    if count_tokens(text) <= max_tokens:
+        return text, False
+    kept, used = [], 0
+    for sentence in SENTENCE_END.split(text):
+        tokens = count_tokens(sentence) + (1 if kept else 0)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return (" ".join(kept) if kept else truncate_tokens(text, max_tokens)), True
@@ -1,9 +1,11 @@
-from typing import Dict, Any, List
-from openai import AzureOpenAI
+from typing import Dict, Any, List, Optional
+import asyncio
 import time
 import os
 from dotenv import load_dotenv
 import logging
+from utils import resilience
+from utils.registry import get_openai_client
 from rag.retriever import Retriever
 from agents.search_agent import SearchAgent
 from agents.analyst_agent import AnalystAgent
@@ -14,18 +16,16 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 class CoordinatorAgent:
-    def __init__(self):
+    def __init__(self, search_agent: Optional[SearchAgent] = None, retriever: Optional[Retriever] = None,
+                 analyst: Optional[AnalystAgent] = None, visualizer: Optional[VisualizerAgent] = None):
         try:
-            self.client = AzureOpenAI(
-                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                api_version="2024-02-01"
-            )
+            self.client = get_openai_client()
             self.deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-            self.search_agent = SearchAgent()
-            self.retriever = Retriever()
-            self.analyst = AnalystAgent()
-            self.visualizer = VisualizerAgent()
+            # Callers that already hold agents (the workflow graph) pass them in
+            self.search_agent = search_agent or SearchAgent()
+            self.retriever = retriever or Retriever()
+            self.analyst = analyst or AnalystAgent()
+            self.visualizer = visualizer or VisualizerAgent()
             logger.info("CoordinatorAgent initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize CoordinatorAgent: {str(e)}")
@@ -35,6 +35,23 @@ class CoordinatorAgent:
         try:
             # Step 1: Search for papers
             search_results = self.search_agent.run(query, max_results=10)
+        except Exception as e:
+            logger.error(f"Coordination failed: {str(e)}")
+            return {"error": f"Coordination failed: {str(e)}"}
+        return self._coordinate_results(query, search_results)
+
+    async def acoordinate(self, query: str) -> Dict[str, Any]:
+        """Async ``coordinate``: the arXiv search and embedding run on the event
+        loop; the remaining blocking steps run in a worker thread."""
+        try:
+            search_results = await self.search_agent.arun(query, max_results=10)
+        except Exception as e:
+            logger.error(f"Coordination failed: {str(e)}")
+            return {"error": f"Coordination failed: {str(e)}"}
+        return await asyncio.to_thread(self._coordinate_results, query, search_results)
+
+    def _coordinate_results(self, query: str, search_results: List[Dict]) -> Dict[str, Any]:
+        try:
             if not search_results:
                 logger.warning(f"No search results for query: {query}")
                 return {"error": "No papers found"}
@@ -67,18 +84,14 @@ class CoordinatorAgent:
                 },
                 {"role": "user", "content": f"Context: {context}"}
             ]
-            start = time.time()
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=messages,
-                temperature=0.1,
-                max_tokens=300
-            )
-            logger.info(f"Coordinator GPT-4o call took {time.time() - start} seconds")
-            next_steps = self._parse_response(response.choices[0].message.content)
+            next_steps = self._next_steps(messages)
 
             result = {
-                "search_results": search_results,
+                # Embeddings are only needed internally; keep them out of the response
+                "search_results": [
+                    {k: v for k, v in paper.items() if k != "embedding"}
+                    for paper in search_results
+                ],
                 "analysis": analysis,
                 "visualizations": visualizations,
                 "next_steps": next_steps,
@@ -90,6 +103,34 @@ class CoordinatorAgent:
             logger.error(f"Coordination failed: {str(e)}")
             return {"error": f"Coordination failed: {str(e)}"}
 
+    def _next_steps(self, messages: List[Dict]) -> List[str]:
+        """Ask the chat model for next steps; degrade to an empty list when the backend is down."""
+        try:
+            start = time.time()
+            response = resilience.call(
+                f"azure-chat:{self.deployment}",
+                self.client.chat.completions.create,
+                model=self.deployment,
+                messages=messages,
+                temperature=0.1,
+                max_tokens=300
+            )
+            logger.info(f"Coordinator GPT-4o call took {time.time() - start} seconds")
+            return self._parse_response(response.choices[0].message.content)
+        except resilience.CircuitOpenError as e:
+            logger.error(f"Next steps skipped: {str(e)}")
+            return []
+
+    def health(self) -> Dict[str, Any]:
+        """Circuit breaker states and retry budget usage for the Azure endpoints,
+        plus the write-behind ingestion queue's counters and query cache hit rate."""
+        health = resilience.circuit_states()
+        if self.retriever.ingest_queue:
+            health["ingest_queue"] = self.retriever.ingest_queue.stats()
+        if self.retriever.query_cache:
+            health["query_cache"] = self.retriever.query_cache.stats()
+        return health
+
     def _parse_response(self, content: str) -> List[str]:
         return [line.strip("-* \n") for line in content.split("\n") if line.strip()]
 
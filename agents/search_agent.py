@@ -1,92 +1,401 @@
-from typing import List, Dict
+from typing import AsyncIterator, Iterator, List, Dict, Optional
+import asyncio
 import logging
-from openai import AzureOpenAI
-import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+import feedparser
+import numpy as np
 from dotenv import load_dotenv
-from arxiv import Client, Search, SortCriterion
+from arxiv import Search, SortCriterion
+from config import EmbeddingConfig, SearchConfig
+from agents.arxiv_cache import get_arxiv_cache
+from rag.embeddings import EmbeddingService, get_embedding_service
+from rag.lexical import bm25_scores
+from utils.registry import get_arxiv_client, get_async_http_client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 load_dotenv()
 
 class SearchAgent:
-    def __init__(self):
+    def __init__(self, prefilter_top_n: int = SearchConfig.PREFILTER_TOP_N):
         try:
-            self.client = AzureOpenAI(
-                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                api_version="2024-02-01"
-            )
-            self.deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-            self.arxiv_client = Client()
+            self.arxiv_client = get_arxiv_client()
+            self.embeddings = get_embedding_service(EmbeddingConfig.SEARCH_PROVIDER)
+            self.arxiv_cache = get_arxiv_cache()
+            self._background_tasks = set()
+            # Only the top-N BM25 candidates are embedded; 0 disables the pre-filter
+            self.prefilter_top_n = prefilter_top_n
+            # Earliest time the next async arXiv request may go out (politeness delay)
+            self._next_arxiv_request = 0.0
             logger.info("SearchAgent initialized successfully")
         except Exception as e:
             logger.error(f"SearchAgent initialization failed: {str(e)}")
             raise
 
-    def run(self, query: str, max_results: int = 10) -> List[Dict]:
+    def run(self, query: str, max_results: int = 10, prefilter_top_n: Optional[int] = None) -> List[Dict]:
         if not query:
             logger.warning("Empty query provided")
             return []
 
-        try:
-            # Perform arXiv search
-            search = Search(
-                query=query,
-                max_results=max_results,
-                sort_by=SortCriterion.SubmittedDate
-            )
-            results = list(self.arxiv_client.results(search))
-            if not results:
-                logger.warning(f"No results found for query: {query}")
-                return []
-
-            # Compute relevance scores using embeddings
-            query_embedding = self._get_embedding(query)
-            processed_results = []
-            for entry in results:
-                try:
-                    summary = entry.summary or ""
-                    content_embedding = self._get_embedding(summary)
-                    relevance_score = self._cosine_similarity(query_embedding, content_embedding)
-                    processed_results.append({
-                        "title": entry.title,
-                        "content": summary,
-                        "authors": [author.name for author in entry.authors],
-                        "url": entry.pdf_url,
-                        "source": "arxiv",
-                        "relevance_score": relevance_score,
-                        "quality_score": 0.7,  # Placeholder, improve if needed
-                        "published": entry.published.isoformat()
-                    })
-                except Exception as e:
-                    logger.error(f"Error processing entry {entry.title}: {str(e)}")
-                    continue
+        processed_results = list(self.iter_results(query, max_results, prefilter_top_n=prefilter_top_n))
+        if not processed_results:
+            logger.warning(f"No results found for query: {query}")
+            return []
+        logger.info(f"Processed {len(processed_results)} results for query: {query}")
+        logger.info(f"Embedding cache stats: {self.embeddings.cache.stats()}")
+        return processed_results
+
+    def iter_results(self, query: str, max_results: int = 10,
+                     batch_size: int = EmbeddingService.BATCH_SIZE,
+                     prefilter_top_n: Optional[int] = None) -> Iterator[Dict]:
+        """Yield scored papers as each embedding batch completes.
+
+        arXiv results are consumed lazily and at most ``batch_size`` papers
+        are held for embedding at a time, so the first papers are usable long
+        before a large harvest finishes. When the lexical pre-filter is on
+        (``prefilter_top_n`` below ``max_results``) all candidates are fetched
+        first and only the top-N by BM25 are embedded.
+        """
+        if not query:
+            logger.warning("Empty query provided")
+            return
 
-            logger.info(f"Processed {len(processed_results)} results for query: {query}")
-            return processed_results
+        try:
+            top_n = self._prefilter_cutoff(prefilter_top_n, max_results)
+            query_vector = self.embeddings.embed_matrix([query])[0]
+            batch = []
+            # Perform arXiv search, served from the result cache where possible
+            papers = self._iter_papers(query, max_results)
+            if top_n:
+                papers = iter(self._prefilter(query, list(papers), top_n))
+            for paper in papers:
+                batch.append(paper)
+                if len(batch) >= batch_size:
+                    yield from self._score_batch(query_vector, batch)
+                    batch = []
+            if batch:
+                yield from self._score_batch(query_vector, batch)
         except Exception as e:
             logger.error(f"Search failed: {str(e)}")
+
+    async def arun(self, query: str, max_results: int = 10, prefilter_top_n: Optional[int] = None) -> List[Dict]:
+        """Non-blocking ``run`` for use on an event loop."""
+        if not query:
+            logger.warning("Empty query provided")
             return []
 
-    def _get_embedding(self, text: str) -> List[float]:
+        processed_results = [
+            paper async for paper in self.aiter_results(query, max_results, prefilter_top_n=prefilter_top_n)
+        ]
+        if not processed_results:
+            logger.warning(f"No results found for query: {query}")
+            return []
+        logger.info(f"Processed {len(processed_results)} results for query: {query}")
+        logger.info(f"Embedding cache stats: {self.embeddings.cache.stats()}")
+        return processed_results
+
+    async def aiter_results(self, query: str, max_results: int = 10,
+                            prefilter_top_n: Optional[int] = None) -> AsyncIterator[Dict]:
+        """Async ``iter_results``.
+
+        arXiv pages are fetched over async HTTP and each page's embedding
+        batch is scheduled as soon as it arrives, so embedding overlaps with
+        fetching the next page. At most ``max_concurrency`` pages are waiting
+        on embeddings at once; scored papers are yielded in arXiv order.
+        """
+        if not query:
+            logger.warning("Empty query provided")
+            return
+
+        query_task = asyncio.ensure_future(self.embeddings.aembed_matrix([query]))
+        pending = deque()
+        try:
+            async for page in self._apaper_pages(query, max_results, prefilter_top_n):
+                pending.append((page, asyncio.ensure_future(
+                    self.embeddings.aembed_matrix([p["content"] for p in page])
+                )))
+                if len(pending) >= self.embeddings.max_concurrency:
+                    for paper in await self._ascore_page(query_task, *pending.popleft()):
+                        yield paper
+            while pending:
+                for paper in await self._ascore_page(query_task, *pending.popleft()):
+                    yield paper
+        except Exception as e:
+            logger.error(f"Search failed: {str(e)}")
+        finally:
+            # No-ops for finished tasks; stops stray work if the fetch failed midway
+            query_task.cancel()
+            for _, task in pending:
+                task.cancel()
+
+    async def _apaper_pages(self, query: str, max_results: int,
+                            prefilter_top_n: Optional[int]) -> AsyncIterator[List[Dict]]:
+        top_n = self._prefilter_cutoff(prefilter_top_n, max_results)
+        if not top_n:
+            async for page in self._afetch_papers(query, max_results):
+                yield page
+            return
+
+        candidates = []
+        async for page in self._afetch_papers(query, max_results):
+            candidates.extend(page)
+        survivors = self._prefilter(query, candidates, top_n)
+        for start in range(0, len(survivors), EmbeddingService.BATCH_SIZE):
+            yield survivors[start:start + EmbeddingService.BATCH_SIZE]
+
+    def _prefilter_cutoff(self, prefilter_top_n: Optional[int], max_results: int) -> int:
+        top_n = self.prefilter_top_n if prefilter_top_n is None else prefilter_top_n
+        return top_n if 0 < top_n < max_results else 0
+
+    def _prefilter(self, query: str, papers: List[Dict], top_n: int) -> List[Dict]:
+        """Keep the ``top_n`` papers by BM25 over title and summary, in arXiv order."""
+        if len(papers) <= top_n:
+            return papers
+        scores = bm25_scores(query, [f"{p.get('title', '')} {p.get('content', '')}" for p in papers])
+        keep = np.sort(np.argsort(-scores, kind="stable")[:top_n])
+        for i in keep:
+            papers[i]["lexical_score"] = float(scores[i])
+        logger.info(f"Lexical pre-filter kept {len(keep)} of {len(papers)} candidates for embedding")
+        return [papers[i] for i in keep]
+
+    async def _ascore_page(self, query_task: asyncio.Future, page: List[Dict],
+                           page_task: asyncio.Future) -> List[Dict]:
+        query_vector = (await query_task)[0]
+        return self._attach_scores(page, query_vector, await page_task)
+
+    def _score_batch(self, query_vector: np.ndarray, batch: List[Dict]) -> List[Dict]:
+        matrix = self.embeddings.embed_matrix([p["content"] for p in batch])
+        return self._attach_scores(batch, query_vector, matrix)
+
+    def _iter_papers(self, query: str, max_results: int) -> Iterator[Dict]:
+        """Lazily yield normalized papers for ``query``, cached prefix first, then
+        only the arXiv results the cache lacks."""
+        key = self.arxiv_cache.make_key(query, SortCriterion.SubmittedDate.value)
+        status, entry = self.arxiv_cache.lookup(key, max_results)
+        if status == "hit":
+            yield from self._copies(entry.papers[:max_results])
+            return
+        if status == "stale":
+            if self.arxiv_cache.start_refresh(key):
+                threading.Thread(
+                    target=self._refresh_cached, args=(key, query, len(entry.papers)), daemon=True
+                ).start()
+            yield from self._copies(entry.papers[:max_results])
+            return
+
+        cached = entry.papers if status == "partial" else []
+        yield from self._copies(cached)
+        papers = list(cached)
+        seen = {self._paper_key(paper) for paper in cached}
+        tally = {"entries": 0}
+        for paper in self._iter_from_arxiv(query, max_results, offset=len(cached), tally=tally):
+            # New submissions push older results down, so an offset fetch can repeat cached papers
+            if self._paper_key(paper) in seen:
+                continue
+            seen.add(self._paper_key(paper))
+            papers.append(dict(paper))
+            yield paper
+        self.arxiv_cache.put(
+            key, papers,
+            # Judged on raw feed entries: skipped duplicates and unparsable entries do not mean the end
+            exhausted=len(cached) + tally["entries"] < max_results,
+            fetched_at=entry.fetched_at if status == "partial" else None
+        )
+        logger.info(f"arXiv cache {status} for query '{query}': fetched {len(papers) - len(cached)} new results")
+
+    def _iter_from_arxiv(self, query: str, max_results: int, offset: int = 0,
+                         tally: Optional[Dict[str, int]] = None) -> Iterator[Dict]:
+        """Papers from the arXiv client; ``tally["entries"]`` counts the raw
+        entries received, including any that fail to parse."""
+        search = Search(
+            query=query,
+            max_results=max_results,
+            sort_by=SortCriterion.SubmittedDate
+        )
+        for entry in self.arxiv_client.results(search, offset=offset):
+            if tally is not None:
+                tally["entries"] += 1
+            try:
+                yield self._paper_from_result(entry)
+            except Exception as e:
+                logger.error(f"Error processing entry {entry.title}: {str(e)}")
+
+    def _refresh_cached(self, key: str, query: str, count: int):
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-3-large",
-                input=text
-            )
-            return response.data[0].embedding
+            tally = {"entries": 0}
+            papers = self._unique(self._iter_from_arxiv(query, count, tally=tally))
+            self.arxiv_cache.put(key, papers, exhausted=tally["entries"] < count)
+            logger.info(f"Refreshed stale arXiv cache entry for query '{query}'")
         except Exception as e:
-            logger.error(f"Embedding failed: {str(e)}")
-            return [0.0] * 1536  # Fallback dimension
+            logger.error(f"Background arXiv refresh failed for query '{query}': {str(e)}")
+        finally:
+            self.arxiv_cache.finish_refresh(key)
+
+    async def _afetch_papers(self, query: str, max_results: int) -> AsyncIterator[List[Dict]]:
+        """Async ``_iter_papers``: yields the cached prefix first, then each newly fetched page."""
+        key = self.arxiv_cache.make_key(query, SortCriterion.SubmittedDate.value)
+        status, entry = self.arxiv_cache.lookup(key, max_results)
+        if status in ("hit", "stale"):
+            if status == "stale" and self.arxiv_cache.start_refresh(key):
+                task = asyncio.ensure_future(self._arefresh_cached(key, query, len(entry.papers)))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+            if entry.papers:
+                yield self._copies(entry.papers[:max_results])
+            return
+
+        cached = entry.papers if status == "partial" else []
+        if cached:
+            yield self._copies(cached)
+        papers = list(cached)
+        seen = {self._paper_key(paper) for paper in cached}
+        tally = {"entries": 0}
+        async for page in self._afetch_arxiv(query, max_results, start=len(cached), tally=tally):
+            # New submissions push older results down, so an offset fetch can repeat cached papers
+            page = [paper for paper in self._unique(page) if self._paper_key(paper) not in seen]
+            seen.update(self._paper_key(paper) for paper in page)
+            if page:
+                papers = papers + self._copies(page)
+                yield page
+        self.arxiv_cache.put(
+            key, papers,
+            # Judged on raw feed entries: skipped duplicates and unparsable entries do not mean the end
+            exhausted=len(cached) + tally["entries"] < max_results,
+            fetched_at=entry.fetched_at if status == "partial" else None
+        )
 
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
+    async def _arefresh_cached(self, key: str, query: str, count: int):
         try:
-            from numpy import dot
-            from numpy.linalg import norm
-            return dot(vec1, vec2) / (norm(vec1) * norm(vec2))
-        except Exception:
-            return 0.5  # Fallback score
+            papers, tally = [], {"entries": 0}
+            async for page in self._afetch_arxiv(query, count, tally=tally):
+                papers.extend(page)
+            self.arxiv_cache.put(key, self._unique(papers), exhausted=tally["entries"] < count)
+            logger.info(f"Refreshed stale arXiv cache entry for query '{query}'")
+        except Exception as e:
+            logger.error(f"Background arXiv refresh failed for query '{query}': {str(e)}")
+        finally:
+            self.arxiv_cache.finish_refresh(key)
+
+    @staticmethod
+    def _copies(papers: List[Dict]) -> List[Dict]:
+        # Scoring adds keys to each paper; keep the cached records untouched
+        return [dict(paper) for paper in papers]
+
+    @staticmethod
+    def _paper_key(paper: Dict) -> str:
+        return paper.get("url") or paper.get("title") or ""
+
+    @classmethod
+    def _unique(cls, papers) -> List[Dict]:
+        """``papers`` without repeats of an earlier paper, in order."""
+        seen, unique = set(), []
+        for paper in papers:
+            if cls._paper_key(paper) not in seen:
+                seen.add(cls._paper_key(paper))
+                unique.append(paper)
+        return unique
+
+    async def _afetch_arxiv(self, query: str, max_results: int, start: int = 0,
+                            tally: Optional[Dict[str, int]] = None) -> AsyncIterator[List[Dict]]:
+        """Yield pages of papers from the arXiv API without blocking the event loop;
+        ``tally["entries"]`` counts the raw feed entries, including unparsable ones."""
+        fetched = start
+        # The process-wide pool, so repeated searches reuse warm connections to arXiv
+        http = get_async_http_client()
+        while fetched < max_results:
+            page_size = min(SearchConfig.ARXIV_PAGE_SIZE, max_results - fetched)
+            await self._arxiv_politeness_delay()
+            response = await http.get(SearchConfig.ARXIV_API_URL, params={
+                "search_query": query,
+                "start": fetched,
+                "max_results": page_size,
+                "sortBy": SortCriterion.SubmittedDate.value,
+                "sortOrder": "descending"
+            }, timeout=SearchConfig.ARXIV_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            feed = feedparser.parse(response.text)
+
+            page = []
+            for entry in feed.entries:
+                try:
+                    page.append(self._paper_from_feed_entry(entry))
+                except Exception as e:
+                    logger.error(f"Error processing entry {entry.get('title', '')}: {str(e)}")
+            if tally is not None:
+                tally["entries"] += len(feed.entries)
+            if page:
+                yield page
+            fetched += len(feed.entries)
+            if len(feed.entries) < page_size:
+                break
+
+    async def _arxiv_politeness_delay(self):
+        # Reserve the next slot before sleeping so concurrent queries on the
+        # same loop queue up instead of all firing together
+        now = time.monotonic()
+        wait = max(0.0, self._next_arxiv_request - now)
+        self._next_arxiv_request = now + wait + SearchConfig.ARXIV_DELAY_SECONDS
+        if wait:
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def _paper_from_result(entry) -> Dict:
+        return {
+            "title": entry.title,
+            "content": entry.summary or "",
+            "authors": [author.name for author in entry.authors],
+            "url": entry.pdf_url,
+            "source": "arxiv",
+            "quality_score": 0.7,  # Placeholder, improve if needed
+            "published": entry.published.isoformat()
+        }
+
+    @staticmethod
+    def _paper_from_feed_entry(entry) -> Dict:
+        """Same shape as ``_paper_from_result`` for a raw Atom feed entry."""
+        pdf_url = next(
+            (link.get("href") for link in entry.get("links", []) if link.get("title") == "pdf"),
+            None
+        )
+        published = datetime(*entry.published_parsed[:6], tzinfo=timezone.utc)
+        return {
+            "title": re.sub(r"\s+", " ", entry.title),
+            "content": entry.get("summary", "") or "",
+            "authors": [author.get("name", "") for author in entry.get("authors", [])],
+            "url": pdf_url,
+            "source": "arxiv",
+            "quality_score": 0.7,  # Placeholder, improve if needed
+            "published": published.isoformat()
+        }
+
+    def _attach_scores(self, papers: List[Dict], query_vector: np.ndarray, matrix: np.ndarray) -> List[Dict]:
+        scores = self._relevance_scores(query_vector, matrix)
+        for paper, embedding, relevance_score in zip(papers, matrix, scores):
+            paper["relevance_score"] = float(relevance_score)
+            # Carried along so the vector store can reuse it instead of re-embedding
+            paper["embedding"] = embedding.tolist() if not np.isnan(embedding[0]) else None
+            paper["embedding_model"] = self.embeddings.model
+        return papers
+
+    def _relevance_scores(self, query_vector: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every row of ``matrix`` to ``query_vector``.
+
+        Rows that failed to embed (or a failed query) score 0.0.
+        """
+        scores = np.zeros(len(matrix), dtype=np.float32)
+        query_norm = np.linalg.norm(query_vector) if query_vector.size else 0.0
+        if not np.isfinite(query_norm) or query_norm == 0:
+            logger.warning("Query embedding unavailable, relevance scores default to 0.0")
+            return scores
+
+        norms = np.linalg.norm(matrix, axis=1)
+        valid = np.isfinite(norms) & (norms > 0)
+        scores[valid] = (matrix[valid] / norms[valid, None]) @ (query_vector / query_norm)
+        return scores
 
 # if __name__ == "__main__":
 #     agent = SearchAgent()
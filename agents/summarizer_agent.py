@@ -1,20 +1,18 @@
+from typing import List
+import logging
 from langchain.prompts import ChatPromptTemplate
-from langchain_openai import AzureChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
-import os
+from config import SummarizerConfig
+from utils.registry import get_chat_model
 from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 load_dotenv()
 
 class SummarizerAgent:
     def __init__(self):
-        self.llm = AzureChatOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-            api_version="2024-02-01",
-            model="gpt-4-turbo",
-            temperature=0.3
-        )
+        self.llm = get_chat_model(model="gpt-4-turbo", temperature=0.3)
         self.chain = self._create_chain()
     
     def _create_chain(self):
@@ -39,6 +37,45 @@ class SummarizerAgent:
         """Generate a professional summary of the content"""
         return self.chain.invoke({"content": content})
 
+    def summarize_many(self, contents: List[str],
+                       max_concurrency: int = SummarizerConfig.MAX_CONCURRENCY) -> List[str]:
+        """Summaries of ``contents`` in order, with up to ``max_concurrency`` calls in flight.
+
+        A failed item gets an error message in its place; the others are unaffected.
+        """
+        if not contents:
+            return []
+        results = self.chain.batch(
+            [{"content": content} for content in contents],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True
+        )
+        return self._collect(results)
+
+    async def asummarize_many(self, contents: List[str],
+                              max_concurrency: int = SummarizerConfig.MAX_CONCURRENCY) -> List[str]:
+        """Async ``summarize_many``."""
+        if not contents:
+            return []
+        results = await self.chain.abatch(
+            [{"content": content} for content in contents],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True
+        )
+        return self._collect(results)
+
+    @staticmethod
+    def _collect(results: List) -> List[str]:
+        failed = [i for i, result in enumerate(results) if isinstance(result, Exception)]
+        for i in failed:
+            logger.error(f"Summary {i + 1} of {len(results)} failed: {str(results[i])}")
+        if failed:
+            logger.warning(f"Summarized {len(results) - len(failed)} of {len(results)} documents")
+        return [
+            f"Summary unavailable: {str(result)}" if isinstance(result, Exception) else result
+            for result in results
+        ]
+
 # if __name__ == "__main__":
 #     agent = SummarizerAgent()
 #     text = """
@@ -8,7 +8,7 @@ class AzureConfig:
     """Central configuration for Azure OpenAI"""
     API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
     ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-    API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-06")  # Default to latest stable version
+    API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01")  # Azure OpenAI REST api-version, not a model version
     CHAT_DEPLOYMENT = os.getenv("AZURE_CHAT_DEPLOYMENT", "gpt-4o")  # Your chat deployment name
     EMBEDDING_DEPLOYMENT = os.getenv("AZURE_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")  # Your embeddings deployment name
 
@@ -22,4 +22,136 @@ class AzureConfig:
         }
         missing = [name for name, value in required_vars.items() if not value]
         if missing:
-            raise ValueError(f"Missing required Azure config variables: {', '.join(missing)}")
\ No newline at end of file
+            raise ValueError(f"Missing required Azure config variables: {', '.join(missing)}")
+
+
+class EmbeddingConfig:
+    """Embedding model shared by search scoring and the vector store, plus its on-disk cache"""
+    # "azure" (Azure OpenAI deployment) or "local" (deterministic hashed n-grams, no network)
+    PROVIDER = os.getenv("EMBEDDING_PROVIDER", "azure")
+    SEARCH_PROVIDER = os.getenv("SEARCH_EMBEDDING_PROVIDER", PROVIDER)
+    RAG_PROVIDER = os.getenv("RAG_EMBEDDING_PROVIDER", PROVIDER)
+    MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+    DEPLOYMENT = os.getenv("AZURE_EMBEDDING_DEPLOYMENT", MODEL)
+    DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+    CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+    CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024
+    CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096"))  # In-memory LRU size
+    MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))  # Parallel async embedding requests
+
+
+class SearchConfig:
+    """arXiv fetch settings for SearchAgent"""
+    ARXIV_API_URL = os.getenv("ARXIV_API_URL", "https://export.arxiv.org/api/query")
+    ARXIV_PAGE_SIZE = int(os.getenv("ARXIV_PAGE_SIZE", "50"))
+    ARXIV_DELAY_SECONDS = float(os.getenv("ARXIV_DELAY_SECONDS", "3"))  # arXiv asks for 3s between requests
+    ARXIV_TIMEOUT_SECONDS = float(os.getenv("ARXIV_TIMEOUT_SECONDS", "30"))
+    PREFILTER_TOP_N = int(os.getenv("SEARCH_PREFILTER_TOP_N", "0"))  # Embed only the top-N BM25 candidates; 0 = off
+    CACHE_PATH = os.getenv("ARXIV_CACHE_PATH", "data/arxiv_cache.db")
+    CACHE_TTL_SECONDS = float(os.getenv("ARXIV_CACHE_TTL_SECONDS", "900"))
+    CACHE_MAX_ENTRIES = int(os.getenv("ARXIV_CACHE_MAX_ENTRIES", "1000"))
+    CACHE_SERVE_STALE = os.getenv("ARXIV_CACHE_SERVE_STALE", "false").lower() == "true"  # Refresh expired entries in the background
+
+
+class ResilienceConfig:
+    """Circuit breaker and retry policy for Azure OpenAI calls"""
+    FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # Consecutive failures before opening
+    RESET_TIMEOUT_SECONDS = float(os.getenv("CIRCUIT_RESET_TIMEOUT_SECONDS", "30"))  # Open -> half-open
+    MAX_RETRIES = int(os.getenv("RESILIENCE_MAX_RETRIES", "2"))  # Per call, on top of the first attempt
+    BACKOFF_BASE_SECONDS = float(os.getenv("RESILIENCE_BACKOFF_BASE_SECONDS", "0.5"))
+    BACKOFF_MAX_SECONDS = float(os.getenv("RESILIENCE_BACKOFF_MAX_SECONDS", "8"))
+    RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))  # Retries allowed per call in the window
+    RETRY_BUDGET_MIN = int(os.getenv("RETRY_BUDGET_MIN", "10"))
+    RETRY_BUDGET_WINDOW_SECONDS = float(os.getenv("RETRY_BUDGET_WINDOW_SECONDS", "60"))
+    REQUEST_TIMEOUT_SECONDS = float(os.getenv("AZURE_REQUEST_TIMEOUT_SECONDS", "30"))
+
+
+class ClientConfig:
+    """Process-wide Azure OpenAI clients and their HTTP connection pool (utils/registry.py)"""
+    MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+    MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+
+
+class VectorStoreConfig:
+    """Storage backend for the RAG vector store"""
+    # "chroma" (Chroma collection) or "mmap" (memory-mapped float32 file + SQLite sidecar, see rag/mmap_store.py)
+    BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+    PERSIST_DIR = os.getenv("VECTOR_STORE_DIR", "data/vector_store")
+    # Filtered mmap searches matching at most this many rows skip the ANN index and score them exactly
+    FILTER_EXACT_MAX_ROWS = int(os.getenv("VECTOR_STORE_FILTER_EXACT_MAX_ROWS", "20000"))
+    # ANN searches fetch at most k * this many candidates to skip tombstoned rows; short queries are rescored exactly
+    TOMBSTONE_OVERFETCH = int(os.getenv("VECTOR_STORE_TOMBSTONE_OVERFETCH", "4"))
+
+
+class AnnIndexConfig:
+    """Approximate nearest-neighbour index for the mmap vector store backend (see rag/ann_index.py)"""
+    KIND = os.getenv("ANN_INDEX_KIND", "hnsw")  # "flat" (exact), "ivfpq" or "hnsw"
+    HNSW_M = int(os.getenv("ANN_HNSW_M", "32"))
+    HNSW_EF_CONSTRUCTION = int(os.getenv("ANN_HNSW_EF_CONSTRUCTION", "200"))
+    HNSW_EF_SEARCH = int(os.getenv("ANN_HNSW_EF_SEARCH", "64"))
+    IVF_NLIST = int(os.getenv("ANN_IVF_NLIST", "0"))  # 0 = 4 * sqrt(corpus size)
+    IVF_NPROBE = int(os.getenv("ANN_IVF_NPROBE", "16"))
+    PQ_M = int(os.getenv("ANN_PQ_M", "64"))  # Sub-quantizers; must divide the embedding dimensions
+    PQ_BITS = int(os.getenv("ANN_PQ_BITS", "8"))
+    # Quantized kinds (fp16, int8, pq, ivfpq) rescore the top k * factor candidates from float32 on disk; 0 = off
+    RERANK_FACTOR = int(os.getenv("ANN_RERANK_FACTOR", "4"))
+    TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "100000"))
+    ADD_BATCH_ROWS = 65536
+    RECALL_QUERIES = int(os.getenv("ANN_RECALL_QUERIES", "200"))  # Held-out queries for the recall@k check
+    RECALL_QUERY_NOISE = float(os.getenv("ANN_RECALL_QUERY_NOISE", "0.3"))  # Perturbation, relative to the vector norm
+
+
+class RetrievalConfig:
+    """How Retriever queries the vector store"""
+    MODE = os.getenv("RETRIEVAL_MODE", "dense")  # "dense", "hybrid" (BM25 + vectors fused with RRF) or "mmr" (diversified dense)
+    TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "10"))
+    CANDIDATE_POOL = int(os.getenv("RETRIEVAL_CANDIDATE_POOL", "30"))  # Results fetched per leg before fusion
+    RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+    EXPAND_QUERIES = os.getenv("RETRIEVAL_EXPAND_QUERIES", "false").lower() == "true"  # Add related phrasings, searched as one batch
+    MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.5"))  # 1.0 ranks by relevance only, lower favours diversity
+
+
+class QueryCacheConfig:
+    """Semantic cache of Retriever results keyed by query embedding (rag/query_cache.py)"""
+    ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+    CAPACITY = int(os.getenv("QUERY_CACHE_CAPACITY", "512"))  # Cached queries; least recently used are evicted
+    SIMILARITY_THRESHOLD = float(os.getenv("QUERY_CACHE_SIMILARITY", "0.92"))  # Cosine at which a paraphrase is a hit
+    TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "600"))
+
+
+class IngestConfig:
+    """Write-behind ingestion of documents passed to Retriever (rag/ingest_queue.py)"""
+    WRITE_BEHIND = os.getenv("INGEST_WRITE_BEHIND", "true").lower() == "true"  # false: add_documents inline per request
+    MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "2000"))  # Queue bound; full queues push back on callers
+    BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+    FLUSH_INTERVAL_SECONDS = float(os.getenv("INGEST_FLUSH_INTERVAL_SECONDS", "2.0"))  # Max wait to fill a batch
+    SUBMIT_TIMEOUT_SECONDS = float(os.getenv("INGEST_SUBMIT_TIMEOUT_SECONDS", "0.5"))  # Then ingest inline
+
+
+class SummarizerConfig:
+    """Batched summarization in the workflow's summarize node"""
+    MAX_CONCURRENCY = int(os.getenv("SUMMARIZER_MAX_CONCURRENCY", "8"))  # Chat calls in flight per batch
+
+
+class AnalystConfig:
+    """Token budget for the evidence AnalystAgent sends to the chat model (agents/context_packer.py)"""
+    CONTEXT_TOKENS = int(os.getenv("ANALYST_CONTEXT_TOKENS", "3000"))
+    MAX_PAPER_TOKENS = int(os.getenv("ANALYST_MAX_PAPER_TOKENS", "700"))  # Cap per paper, so one cannot fill the budget
+    MIN_PAPER_TOKENS = int(os.getenv("ANALYST_MIN_PAPER_TOKENS", "60"))  # Smaller remainders are not worth a paper
+
+
+class ChunkingConfig:
+    """Token-based chunking of long documents in the vector store (see rag/chunking.py)"""
+    ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")  # Tokenizer of the text-embedding-3 models
+    CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "512"))  # Documents longer than this are split
+    OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+    EXCERPT_TOKENS = int(os.getenv("CHUNK_EXCERPT_TOKENS", "1024"))  # Text returned per collapsed parent
+    OVERFETCH = int(os.getenv("CHUNK_OVERFETCH", "3"))  # Chunk hits fetched per requested parent
+
+
+class MaintenanceConfig:
+    """Vector store maintenance job (python -m rag.maintenance)"""
+    MAX_AGE_DAYS = float(os.getenv("MAINTENANCE_MAX_AGE_DAYS", "0"))  # Evict documents unused for longer; 0 disables
+    MAX_DOCUMENTS = int(os.getenv("MAINTENANCE_MAX_DOCUMENTS", "0"))  # Evict least recently used beyond this; 0 disables
+    LATENCY_QUERIES = int(os.getenv("MAINTENANCE_LATENCY_QUERIES", "50"))  # Stored vectors replayed as latency probes
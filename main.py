@@ -83,8 +83,12 @@ class ResearchQuery(BaseModel):
 @app.post("/research")
 async def research(query: ResearchQuery):
     logger.info(f"Received query: {query.query}")
-    result = coordinator.coordinate(query.query)
+    result = await coordinator.acoordinate(query.query)
     return result
 
+@app.get("/health")
+async def health():
+    return coordinator.health()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
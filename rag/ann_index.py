@@ -0,0 +1,388 @@
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from config import AnnIndexConfig
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_KINDS = ("flat", "ivfpq", "hnsw", "fp16", "int8", "pq")
+# Kinds that keep compressed codes instead of float32 vectors and so benefit from an exact rerank
+QUANTIZED_KINDS = ("ivfpq", "fp16", "int8", "pq")
+
+
+class AnnIndex:
+    """FAISS index over the first ``rows`` vectors of an ``MmapVectorStore``.
+
+    FAISS labels are store row numbers, so results map straight back to the
+    sidecar. The quantized kinds (``fp16``, ``int8``, ``pq`` and ``ivfpq``)
+    hold 2-64x less memory than the float32 rows and can rescore their top
+    candidates exactly against the full-precision vectors on disk.
+
+    Rows appended after the build are not in the index; the store scores
+    them exactly and merges, so the index only needs rebuilding when that
+    tail gets large.
+    """
+
+    INDEX_FILE = "ann.faiss"
+    META_FILE = "ann.json"
+    MIN_PQ_BITS = 4  # Below this, PQ codebooks are too coarse to be worth training
+    POINTS_PER_CENTROID = 39  # Fewest training points per k-means centroid FAISS accepts without warning
+
+    def __init__(self, index, kind: str, params: Dict, rows: int, report: Optional[Dict] = None):
+        self.index = index
+        self.kind = kind
+        self.params = params
+        self.rows = rows
+        self.report = report or {}
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, kind: str = AnnIndexConfig.KIND, **params) -> "AnnIndex":
+        """Build an inner-product index over ``vectors`` (L2-normalized rows)."""
+        if kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown index kind: {kind}")
+        n, dims = vectors.shape
+        params = {**cls.default_params(kind), **{k: v for k, v in params.items() if v is not None}}
+        if kind in ("ivfpq", "pq"):
+            # Each PQ codebook has 2^bits centroids to train, so small collections get fewer bits
+            bits = min(params["pq_bits"], int(np.log2(max(n // cls.POINTS_PER_CENTROID, 1))))
+            if bits < cls.MIN_PQ_BITS:
+                logger.warning(f"{n} vectors are too few to train {kind}; building an int8 index instead")
+                kind = "int8"
+                params = {**cls.default_params(kind), "rerank_factor": params["rerank_factor"]}
+            elif bits < params["pq_bits"]:
+                logger.info(f"Using {bits}-bit PQ codes for {n} vectors instead of {params['pq_bits']}")
+                params["pq_bits"] = bits
+        start = time.time()
+
+        if kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dims, params["m"], faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = params["ef_construction"]
+        elif kind == "ivfpq":
+            nlist = params["nlist"] or max(1, int(4 * np.sqrt(n)))
+            # k-means needs ~39 points per centroid
+            nlist = max(1, min(nlist, n // cls.POINTS_PER_CENTROID))
+            cls._check_pq(params, n, dims)
+            params["nlist"] = nlist
+            quantizer = faiss.IndexFlatIP(dims)
+            index = faiss.IndexIVFPQ(
+                quantizer, dims, nlist, params["pq_m"], params["pq_bits"], faiss.METRIC_INNER_PRODUCT
+            )
+        elif kind == "pq":
+            cls._check_pq(params, n, dims)
+            index = faiss.IndexPQ(dims, params["pq_m"], params["pq_bits"], faiss.METRIC_INNER_PRODUCT)
+        elif kind in ("fp16", "int8"):
+            qtype = faiss.ScalarQuantizer.QT_fp16 if kind == "fp16" else faiss.ScalarQuantizer.QT_8bit
+            index = faiss.IndexScalarQuantizer(dims, qtype, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexFlatIP(dims)
+
+        if not index.is_trained:
+            sample = vectors[np.sort(np.random.default_rng(0).permutation(n)[:AnnIndexConfig.TRAIN_SAMPLE])]
+            index.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+        for begin in range(0, n, AnnIndexConfig.ADD_BATCH_ROWS):  # Keeps the mmap from being copied whole
+            index.add(np.ascontiguousarray(vectors[begin:begin + AnnIndexConfig.ADD_BATCH_ROWS], dtype=np.float32))
+        ann = cls(index, kind, params, n)
+        ann.set_search_params()
+        logger.info(f"Built {kind} index over {n} vectors in {time.time() - start:.1f}s with {params}")
+        return ann
+
+    @staticmethod
+    def _check_pq(params: Dict, n: int, dims: int):
+        if dims % params["pq_m"]:
+            raise ValueError(f"pq_m={params['pq_m']} must divide the {dims} dimensions")
+        if n < 2 ** params["pq_bits"]:
+            raise ValueError(f"PQ needs at least {2 ** params['pq_bits']} vectors to train, have {n}")
+
+    @staticmethod
+    def default_params(kind: str) -> Dict:
+        params = {}
+        if kind == "hnsw":
+            params = {
+                "m": AnnIndexConfig.HNSW_M,
+                "ef_construction": AnnIndexConfig.HNSW_EF_CONSTRUCTION,
+                "ef_search": AnnIndexConfig.HNSW_EF_SEARCH
+            }
+        if kind == "ivfpq":
+            params = {"nlist": AnnIndexConfig.IVF_NLIST, "nprobe": AnnIndexConfig.IVF_NPROBE}
+        if kind in ("ivfpq", "pq"):
+            params.update({"pq_m": AnnIndexConfig.PQ_M, "pq_bits": AnnIndexConfig.PQ_BITS})
+        if kind in QUANTIZED_KINDS:
+            params["rerank_factor"] = AnnIndexConfig.RERANK_FACTOR
+        return params
+
+    def set_search_params(self, ef_search: Optional[int] = None, nprobe: Optional[int] = None,
+                          rerank_factor: Optional[int] = None):
+        """Apply search-time knobs; these need no rebuild."""
+        if rerank_factor is not None:
+            self.params["rerank_factor"] = rerank_factor
+        if self.kind == "hnsw":
+            self.params["ef_search"] = ef_search or self.params["ef_search"]
+            self.index.hnsw.efSearch = self.params["ef_search"]
+        elif self.kind == "ivfpq":
+            self.params["nprobe"] = nprobe or self.params["nprobe"]
+            faiss.extract_index_ivf(self.index).nprobe = self.params["nprobe"]
+
+    def search(self, queries: np.ndarray, k: int, vectors: Optional[np.ndarray] = None,
+               allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """``(scores, rows)`` for each query row; missing hits have row -1.
+
+        With ``vectors`` (the full-precision rows) and a ``rerank_factor``, the
+        top ``k * rerank_factor`` candidates are rescored exactly. ``allowed``
+        restricts results to those rows inside the index search itself.
+        """
+        k = min(k, self.rows)
+        if k <= 0:
+            return np.zeros((len(queries), 0), np.float32), np.zeros((len(queries), 0), np.int64)
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        params = self._search_parameters(allowed)
+        factor = self.params.get("rerank_factor", 0)
+        if vectors is None or factor <= 1:
+            return self.index.search(queries, k, params=params)
+        _, candidates = self.index.search(queries, min(k * factor, self.rows), params=params)
+        return rerank(vectors, queries, candidates, k)
+
+    def _search_parameters(self, allowed: Optional[np.ndarray]):
+        if allowed is None:
+            return None
+        selector = faiss.IDSelectorBatch(np.ascontiguousarray(allowed, dtype=np.int64))
+        if self.kind == "hnsw":
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=self.params["ef_search"])
+        elif self.kind == "ivfpq":
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.params["nprobe"])
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        params._selector = selector  # The SWIG object does not keep the selector alive
+        return params
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size, without serializing a copy of the index."""
+        n, dims = self.index.ntotal, self.index.d
+        if self.kind == "hnsw":
+            # Stored vectors plus ~2*M neighbour links per node at level 0
+            return n * (dims * 4 + 2 * self.params["m"] * 4)
+        codebooks = (2 ** self.params["pq_bits"]) * dims * 4 if "pq_bits" in self.params else 0
+        if self.kind == "ivfpq":
+            ivf = faiss.extract_index_ivf(self.index)
+            return n * (ivf.code_size + 8) + ivf.nlist * dims * 4 + codebooks
+        if self.kind == "pq":
+            return n * self.index.pq.code_size + codebooks
+        if self.kind == "fp16":
+            return n * dims * 2
+        if self.kind == "int8":
+            return n * dims + 2 * dims * 4  # Codes plus per-dimension range
+        return n * dims * 4
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        faiss.write_index(self.index, str(directory / self.INDEX_FILE))
+        meta = {"kind": self.kind, "params": self.params, "rows": self.rows, "report": self.report}
+        (directory / self.META_FILE).write_text(json.dumps(meta, indent=2))
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["AnnIndex"]:
+        directory = Path(directory)
+        if not (directory / cls.META_FILE).exists():
+            return None
+        meta = json.loads((directory / cls.META_FILE).read_text())
+        path = str(directory / cls.INDEX_FILE)
+        try:
+            # Shares pages between processes where the index type supports it
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            index = faiss.read_index(path)
+        ann = cls(index, meta["kind"], meta["params"], meta["rows"], meta.get("report"))
+        ann.set_search_params()
+        return ann
+
+    @classmethod
+    def remove(cls, directory: Path):
+        for name in (cls.INDEX_FILE, cls.META_FILE):
+            (Path(directory) / name).unlink(missing_ok=True)
+
+
+def rerank(vectors: np.ndarray, queries: np.ndarray, candidates: np.ndarray,
+           k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Rescore candidate rows per query against full-precision ``vectors``."""
+    scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    rows = np.full((len(queries), k), -1, dtype=np.int64)
+    for i, (query, found) in enumerate(zip(queries, candidates)):
+        found = np.unique(found[found >= 0])  # Sorted, so the mmap is read front to back
+        exact = np.asarray(vectors[found]) @ query
+        top = np.argsort(-exact)[:k]
+        scores[i, :len(top)] = exact[top]
+        rows[i, :len(top)] = found[top]
+    return scores, rows
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, chunk_rows: int = 65536) -> np.ndarray:
+    """Row indices of the exact top-``k`` inner products per query, best first."""
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(vectors), chunk_rows):
+        scores = queries @ np.asarray(vectors[start:start + chunk_rows]).T
+        rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        best_rows = np.concatenate([best_rows, rows], axis=1)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        if best_scores.shape[1] > k:
+            keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_rows, order, axis=1)
+
+
+def recall_at_k(ann: AnnIndex, vectors: np.ndarray, k: int = 10,
+                num_queries: int = AnnIndexConfig.RECALL_QUERIES, seed: int = 0,
+                noise: float = AnnIndexConfig.RECALL_QUERY_NOISE) -> Dict:
+    """Recall@k and per-query latency of ``ann`` against exact search.
+
+    Queries are a sample of stored vectors with Gaussian noise of ``noise``
+    times their norm added, so they are not points in the index (a stored
+    vector finds its own cell or graph node trivially). Each query's source
+    row is also dropped from both result lists.
+    """
+    n = min(ann.rows, len(vectors))
+    if n <= k:
+        return {"k": k, "queries": 0, "recall": 1.0}
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(n, size=min(num_queries, n), replace=False)
+    queries = np.asarray(vectors[rows], dtype=np.float32)
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    perturbation = rng.standard_normal(queries.shape).astype(np.float32)
+    perturbation *= noise * norms / np.sqrt(queries.shape[1])
+    queries = queries + perturbation
+    # Back onto the stored vectors' norms, so inner-product rankings stay comparable
+    queries *= norms / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    start = time.time()
+    truth = exact_top_k(vectors[:n], queries, k + 1)
+    exact_ms = (time.time() - start) * 1000 / len(rows)
+    start = time.time()
+    _, found = ann.search(queries, k + 1, vectors)
+    ann_ms = (time.time() - start) * 1000 / len(rows)
+
+    hits = 0
+    for row, expected, got in zip(rows, truth, found):
+        expected = [r for r in expected if r != row][:k]
+        got = [r for r in got if r != row and r >= 0][:k]
+        hits += len(set(expected) & set(got))
+    return {
+        "k": k,
+        "queries": len(rows),
+        "recall": round(hits / (k * len(rows)), 4),
+        "ann_ms_per_query": round(ann_ms, 3),
+        "exact_ms_per_query": round(exact_ms, 3),
+        "index_bytes": ann.memory_bytes(),
+        "kind": ann.kind,
+        "params": dict(ann.params)
+    }
+
+
+def quantization_report(vectors: np.ndarray, k: int = 10, num_queries: int = AnnIndexConfig.RECALL_QUERIES,
+                        rerank_factors: Tuple[int, ...] = (0, AnnIndexConfig.RERANK_FACTOR)) -> List[Dict]:
+    """Memory saved and recall lost for each quantized storage setting,
+    relative to the float32 vectors scanned exactly."""
+    n, dims = vectors.shape
+    float32_bytes = n * dims * 4
+    report = []
+    for kind in ("fp16", "int8", "pq", "ivfpq"):
+        try:
+            ann = AnnIndex.build(vectors, kind)
+        except ValueError as e:
+            logger.warning(f"Skipping {kind}: {str(e)}")
+            continue
+        for factor in sorted(set(rerank_factors)):
+            ann.set_search_params(rerank_factor=factor)
+            result = recall_at_k(ann, vectors, k=k, num_queries=num_queries)
+            report.append({
+                "kind": kind,
+                "rerank_factor": factor,
+                "index_bytes": result["index_bytes"],
+                "float32_bytes": float32_bytes,
+                "memory_saved": round(1 - result["index_bytes"] / float32_bytes, 4),
+                "recall": result["recall"],
+                "recall_lost": round(1 - result["recall"], 4),
+                "ms_per_query": result["ann_ms_per_query"]
+            })
+    return report
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    from rag.vector_store import VectorStoreManager
+
+    parser = argparse.ArgumentParser(description="Build and evaluate the ANN index of the mmap vector store")
+    parser.add_argument("command", choices=["build", "rebuild", "evaluate", "drop", "quantization-report"])
+    parser.add_argument("--kind", choices=INDEX_KINDS, default=None)
+    parser.add_argument("--m", type=int, help="HNSW neighbours per node")
+    parser.add_argument("--ef-construction", type=int)
+    parser.add_argument("--ef-search", type=_int_list, help="HNSW efSearch; comma-separated to sweep")
+    parser.add_argument("--nlist", type=int, help="IVF lists (default: 4*sqrt(n))")
+    parser.add_argument("--nprobe", type=_int_list, help="IVF lists probed; comma-separated to sweep")
+    parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers (must divide the dimensions)")
+    parser.add_argument("--pq-bits", type=int)
+    parser.add_argument("--rerank-factor", type=_int_list,
+                        help="Exact rerank of k*factor candidates for quantized kinds (0 = off); comma-separated to sweep")
+    parser.add_argument("--sample", type=int, default=100000, help="Rows used by quantization-report")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=AnnIndexConfig.RECALL_QUERIES)
+    args = parser.parse_args()
+
+    manager = VectorStoreManager(backend="mmap")
+    store = manager.vector_store
+
+    if args.command == "drop":
+        store.drop_index()
+        return
+    if args.command == "quantization-report":
+        vectors, _ = store._snapshot()
+        factors = tuple(args.rerank_factor) if args.rerank_factor else (0, AnnIndexConfig.RERANK_FACTOR)
+        for row in quantization_report(vectors[:args.sample], k=args.k, num_queries=args.queries,
+                                       rerank_factors=factors):
+            print(json.dumps(row))
+        return
+    if args.command in ("build", "rebuild"):
+        # rebuild keeps the current kind and parameters unless overridden
+        previous = store.index if args.command == "rebuild" and store.index else None
+        kind = args.kind or (previous.kind if previous else AnnIndexConfig.KIND)
+        params = dict(previous.params) if previous and previous.kind == kind else {}
+        overrides = {
+            "m": args.m, "ef_construction": args.ef_construction, "nlist": args.nlist,
+            "pq_m": args.pq_m, "pq_bits": args.pq_bits,
+            "ef_search": args.ef_search[0] if args.ef_search else None,
+            "nprobe": args.nprobe[0] if args.nprobe else None,
+            "rerank_factor": args.rerank_factor[0] if args.rerank_factor else None
+        }
+        params.update({k: v for k, v in overrides.items() if v is not None})
+        store.build_index(kind, recall_k=args.k, recall_queries=args.queries, **params)
+        print(json.dumps(store.index.report, indent=2))
+        return
+
+    if store.index is None:
+        raise SystemExit("No index built; run the build command first")
+    vectors, _ = store._snapshot()
+    settings = (
+        [{"ef_search": v} for v in args.ef_search or []]
+        + [{"nprobe": v} for v in args.nprobe or []]
+        + [{"rerank_factor": v} for v in args.rerank_factor or []]
+    )
+    for setting in settings or [{}]:
+        store.index.set_search_params(**setting)
+        print(json.dumps(recall_at_k(store.index, vectors, k=args.k, num_queries=args.queries)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from functools import lru_cache
+from typing import List
+import logging
+
+import tiktoken
+
+from config import ChunkingConfig
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = ChunkingConfig.ENCODING):
+    return tiktoken.get_encoding(name)
+
+
+def count_tokens(text: str, encoding: str = ChunkingConfig.ENCODING) -> int:
+    return len(get_encoding(encoding).encode(text or "", disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, encoding: str = ChunkingConfig.ENCODING) -> str:
+    """``text`` cut to at most ``max_tokens`` tokens."""
+    tokens = get_encoding(encoding).encode(text or "", disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding(encoding).decode(tokens[:max_tokens])
+
+
+class TokenChunker:
+    """Splits text into windows of at most ``chunk_tokens`` tokens, each
+    overlapping the previous one by ``overlap`` tokens so sentences cut at a
+    boundary still appear whole in one chunk."""
+
+    def __init__(
+        self,
+        chunk_tokens: int = ChunkingConfig.CHUNK_TOKENS,
+        overlap: int = ChunkingConfig.OVERLAP_TOKENS,
+        encoding: str = ChunkingConfig.ENCODING
+    ):
+        if not 0 <= overlap < chunk_tokens:
+            raise ValueError("overlap must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap = overlap
+        self.encoding = encoding
+        self._encoding_failed = False
+
+    def split(self, text: str) -> List[str]:
+        """Chunks of ``text``; a text that fits in one chunk is returned as is,
+        as is every text when the encoding cannot be loaded."""
+        # Every token covers at least one UTF-8 byte, so short texts skip tokenization
+        if len((text or "").encode("utf-8")) <= self.chunk_tokens or self._encoding_failed:
+            return [text]
+        try:
+            encoding = get_encoding(self.encoding)
+        except Exception as e:
+            # tiktoken downloads encodings on first use; stay unchunked rather than fail the ingest
+            logger.warning(f"Encoding {self.encoding} unavailable, storing documents unchunked: {str(e)}")
+            self._encoding_failed = True
+            return [text]
+        tokens = encoding.encode(text or "", disallowed_special=())
+        if len(tokens) <= self.chunk_tokens:
+            return [text]
+        step = self.chunk_tokens - self.overlap
+        chunks = []
+        for start in range(0, len(tokens), step):
+            chunks.append(encoding.decode(tokens[start:start + self.chunk_tokens]))
+            if start + self.chunk_tokens >= len(tokens):
+                break
+        return chunks
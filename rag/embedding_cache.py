@@ -0,0 +1,312 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import EmbeddingConfig
+from utils.registry import shared
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache.
+
+    Vectors live in an append-only float32 file that is read through a
+    memory map; a SQLite index maps hash(model, dimensions, text) to the
+    vector's offset. A small in-memory LRU sits in front of both. When the
+    live vectors exceed ``max_bytes`` the least recently used entries are
+    evicted and the live vectors are compacted into a new generation file.
+
+    Several processes may share one cache directory: writers are serialized
+    by SQLite's write lock, offsets and the generation switch commit together,
+    and readers remap when the generation or the committed length changes.
+    """
+
+    TOUCH_BATCH = 256  # Buffered last-access updates written per flush
+    TOUCH_INTERVAL_SECONDS = 30.0  # Oldest a buffered last-access update may get
+
+    def __init__(
+        self,
+        cache_dir: str = EmbeddingConfig.CACHE_DIR,
+        max_bytes: int = EmbeddingConfig.CACHE_MAX_BYTES,
+        memory_items: int = EmbeddingConfig.CACHE_MEMORY_ITEMS
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+
+        self._lock = threading.RLock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._mmap: Optional[np.memmap] = None
+        self._mapped_generation = -1
+        self._touched: Dict[str, float] = {}
+        self._touched_since = time.time()
+        self._db = sqlite3.connect(
+            str(self.cache_dir / "index.db"), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, offset INTEGER NOT NULL, dim INTEGER NOT NULL, last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access);
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute("INSERT OR IGNORE INTO info VALUES ('generation', 0)")
+            self._db.execute("INSERT OR IGNORE INTO info VALUES ('floats', 0)")
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        self._data_file(self._info("generation")).touch(exist_ok=True)
+        self._remove_old_generations()
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        logger.info(f"EmbeddingCache initialized at {self.cache_dir}")
+
+    @property
+    def data_path(self) -> Path:
+        """Data file of the current generation."""
+        return self._data_file(self._info("generation"))
+
+    @staticmethod
+    def make_key(model: str, dimensions: Optional[int], text: str) -> str:
+        payload = f"{model}\x00{dimensions or 0}\x00{text}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, model: str, dimensions: Optional[int], texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Return cached vectors for ``texts``; ``None`` marks a miss."""
+        keys = [self.make_key(model, dimensions, text) for text in texts]
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            now = time.time()
+            disk_lookups: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+                    self._touched[key] = now
+                else:
+                    disk_lookups.setdefault(key, []).append(i)
+
+            if disk_lookups:
+                try:
+                    # One read transaction, so offsets and generation come from the same commit
+                    self._db.execute("BEGIN")
+                    try:
+                        rows = self._select_entries(list(disk_lookups))
+                        data = self._data() if rows else None
+                    finally:
+                        self._db.execute("COMMIT")
+                except (OSError, ValueError) as e:
+                    # Another process compacted and removed the file between our reads
+                    logger.warning(f"Embedding cache read failed, treating as misses: {str(e)}")
+                    rows = []
+                for key, offset, dim in rows:
+                    vector = np.array(data[offset:offset + dim], dtype=np.float32)
+                    self._remember(key, vector)
+                    self._touched[key] = now
+                    for i in disk_lookups[key]:
+                        found[i] = vector
+
+            # Last-access times only order eviction, so they are written in batches
+            if len(self._touched) >= self.TOUCH_BATCH or (
+                self._touched and now - self._touched_since >= self.TOUCH_INTERVAL_SECONDS
+            ):
+                try:
+                    self._db.execute("BEGIN IMMEDIATE")
+                    try:
+                        self._flush_touches()
+                        self._db.execute("COMMIT")
+                    except Exception:
+                        self._db.execute("ROLLBACK")
+                        raise
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not record embedding cache access times: {str(e)}")
+
+            for vector in found:
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self.bytes_saved += vector.nbytes
+        return found
+
+    def put_many(self, model: str, dimensions: Optional[int], texts: List[str], vectors: List[np.ndarray]):
+        """Store vectors for ``texts``, skipping any already cached."""
+        if not texts:
+            return
+        with self._lock:
+            now = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._flush_touches()
+                offset = self._info("floats")
+                entries = []
+                written = set()
+                chunks = []
+                for text, vector in zip(texts, vectors):
+                    key = self.make_key(model, dimensions, text)
+                    vector = np.asarray(vector, dtype=np.float32)
+                    self._remember(key, vector)
+                    if key in written or self._select_entries([key]):
+                        continue
+                    written.add(key)
+                    chunks.append(vector.tobytes())
+                    entries.append((key, offset, vector.size, now))
+                    offset += vector.size
+                if entries:
+                    with open(self._data_file(self._info("generation")), "r+b") as f:
+                        # Drop vectors appended by a writer that died before committing
+                        f.truncate(self._info("floats") * 4)
+                        f.seek(0, os.SEEK_END)
+                        f.write(b"".join(chunks))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO entries (key, offset, dim, last_access) VALUES (?, ?, ?, ?)",
+                        entries
+                    )
+                    self._db.execute("UPDATE info SET value = ? WHERE key = 'floats'", (offset,))
+                compacted = self._evict_if_needed()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            if compacted:
+                self._remove_old_generations()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, live_floats = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(dim), 0) FROM entries"
+            ).fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_saved": self.bytes_saved,
+                "entries": entries,
+                "live_bytes": live_floats * 4,
+                "file_bytes": self.data_path.stat().st_size
+            }
+
+    def _select_entries(self, keys: List[str]) -> List[tuple]:
+        rows = []
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(self._db.execute(
+                f"SELECT key, offset, dim FROM entries WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        return rows
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _flush_touches(self):
+        """Write buffered last-access times; the caller holds the write transaction."""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE entries SET last_access = MAX(last_access, ?) WHERE key = ?",
+                [(when, key) for key, when in self._touched.items()]
+            )
+            self._touched.clear()
+        self._touched_since = time.time()
+
+    def _data(self) -> np.ndarray:
+        """Committed vectors of the current generation, remapped when another
+        process compacted or appended past the mapped length."""
+        generation = self._info("generation")
+        floats = self._info("floats")
+        if self._mmap is None or generation != self._mapped_generation or len(self._mmap) < floats:
+            self._mmap = (
+                np.memmap(self._data_file(generation), dtype=np.float32, mode="r", shape=(floats,))
+                if floats else None
+            )
+            self._mapped_generation = generation
+        return self._mmap if self._mmap is not None else np.empty(0, dtype=np.float32)
+
+    def _evict_if_needed(self) -> bool:
+        """Evict down to 90% of the budget and compact; runs inside the
+        caller's write transaction. True when the data file was replaced."""
+        live_floats = self._db.execute("SELECT COALESCE(SUM(dim), 0) FROM entries").fetchone()[0]
+        if live_floats * 4 <= self.max_bytes:
+            return False
+
+        # Evict least recently used entries down to 90% of the budget
+        target = int(self.max_bytes * 0.9) // 4
+        evicted = []
+        for key, dim in self._db.execute("SELECT key, dim FROM entries ORDER BY last_access ASC").fetchall():
+            if live_floats <= target:
+                break
+            evicted.append((key,))
+            live_floats -= dim
+        self._db.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        for (key,) in evicted:
+            self._memory.pop(key, None)
+        logger.info(f"Evicted {len(evicted)} embeddings from cache")
+        self._compact()
+        return True
+
+    def _compact(self):
+        """Copy the live vectors into the next generation file; the new offsets
+        and the generation switch commit with the caller's transaction."""
+        data = self._data()
+        generation = self._info("generation")
+        updates = []
+        offset = 0
+        with open(self._data_file(generation + 1), "wb") as f:
+            for key, old_offset, dim in self._db.execute("SELECT key, offset, dim FROM entries").fetchall():
+                f.write(np.asarray(data[old_offset:old_offset + dim], dtype=np.float32).tobytes())
+                updates.append((offset, key))
+                offset += dim
+            f.flush()
+            os.fsync(f.fileno())
+        del data
+        self._db.executemany("UPDATE entries SET offset = ? WHERE key = ?", updates)
+        self._db.execute("UPDATE info SET value = ? WHERE key = 'floats'", (offset,))
+        self._db.execute("UPDATE info SET value = value + 1 WHERE key = 'generation'")
+
+    def _data_file(self, generation: int) -> Path:
+        return self.cache_dir / ("vectors.f32" if generation == 0 else f"vectors.{generation}.f32")
+
+    def _remove_old_generations(self):
+        """Delete data files superseded by a compaction; processes that still
+        map one keep reading it until they notice the new generation."""
+        current = self._info("generation")
+        for path in self.cache_dir.glob("vectors*.f32"):
+            parts = path.name.split(".")
+            generation = int(parts[1]) if len(parts) == 3 and parts[1].isdigit() else 0
+            if generation < current:
+                try:
+                    path.unlink(missing_ok=True)
+                except OSError as e:
+                    logger.warning(f"Could not remove old embedding cache file {path}: {str(e)}")
+
+    def _info(self, key: str) -> int:
+        return self._db.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()[0]
+
+
+def get_embedding_cache(cache_dir: str = EmbeddingConfig.CACHE_DIR) -> EmbeddingCache:
+    """Return the process-wide cache for ``cache_dir`` so all callers share hits."""
+    return shared(("embedding-cache", str(Path(cache_dir).resolve())), lambda: EmbeddingCache(cache_dir))
+
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import re
+import weakref
+import zlib
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from openai import AsyncAzureOpenAI, AzureOpenAI
+
+from config import EmbeddingConfig
+from rag.embedding_cache import EmbeddingCache, get_embedding_cache
+from utils import resilience
+from utils.registry import get_async_openai_client, get_openai_client, shared
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+
+class EmbeddingProvider:
+    """Backend that turns texts into raw vectors.
+
+    ``EmbeddingService`` adds batching, caching and per-entry failure
+    isolation on top, so providers only implement ``embed_batch``.
+    """
+
+    model: str
+    dimensions: int
+    cacheable = True  # Whether vectors are worth keeping in the on-disk cache
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_batch(texts)
+
+
+class AzureEmbeddingProvider(EmbeddingProvider):
+    """Azure OpenAI embeddings deployment."""
+
+    def __init__(
+        self,
+        client: Optional[AzureOpenAI] = None,
+        async_client: Optional[AsyncAzureOpenAI] = None,
+        deployment: str = EmbeddingConfig.DEPLOYMENT,
+        model: str = EmbeddingConfig.MODEL,
+        dimensions: int = EmbeddingConfig.DIMENSIONS
+    ):
+        # Retries are handled by utils.resilience under a shared budget
+        self.client = client or get_openai_client()
+        self._async_client = async_client
+        self.deployment = deployment
+        self.model = model
+        self.dimensions = dimensions
+        self.endpoint = f"azure-embeddings:{deployment}"
+
+    @property
+    def async_client(self) -> AsyncAzureOpenAI:
+        if self._async_client is None:
+            self._async_client = get_async_openai_client()
+        return self._async_client
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = resilience.call(
+            self.endpoint,
+            self.client.embeddings.create,
+            model=self.deployment,
+            input=texts,
+            dimensions=self.dimensions
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = await resilience.acall(
+            self.endpoint,
+            self.async_client.embeddings.create,
+            model=self.deployment,
+            input=texts,
+            dimensions=self.dimensions
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Fully local, deterministic embeddings from hashed word and character n-grams.
+
+    Quality is far below a neural model, but vectors cost microseconds, need
+    no network and are identical across runs and machines, which makes them
+    suitable for offline work and reproducible benchmarks.
+    """
+
+    cacheable = False  # Recomputing is cheaper than a cache lookup
+
+    def __init__(self, dimensions: int = EmbeddingConfig.DIMENSIONS, ngram_range=(3, 5)):
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+        self.model = f"hashing-ngram-{ngram_range[0]}-{ngram_range[1]}"
+        # Vocabulary repeats heavily across abstracts, so memoize each word's features
+        self._word_features = lru_cache(maxsize=65536)(self._features)
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def _embed(self, text: str) -> List[float]:
+        words = re.findall(r"\w+", text.lower())
+        if not words:
+            return [0.0] * self.dimensions
+        features = [self._word_features(word) for word in words]
+        indices = np.concatenate([f[0] for f in features])
+        weights = np.concatenate([f[1] for f in features])
+        vector = np.bincount(indices, weights=weights, minlength=self.dimensions)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _features(self, word: str):
+        """Hashed bucket indices and signed weights for a word and its character n-grams."""
+        grams = [(f"w:{word}", 1.0)]
+        padded = f"<{word}>"
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for start in range(max(1, len(padded) - n + 1)):
+                grams.append((padded[start:start + n], 0.5))
+        # crc32 rather than hash() so vectors do not change with PYTHONHASHSEED
+        hashes = np.array([zlib.crc32(gram.encode("utf-8")) for gram, _ in grams], dtype=np.int64)
+        weights = np.array([weight for _, weight in grams])
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+        return hashes % self.dimensions, weights * signs
+
+
+def create_provider(name: str) -> EmbeddingProvider:
+    if name == "azure":
+        return AzureEmbeddingProvider()
+    if name == "local":
+        return HashingEmbeddingProvider()
+    raise ValueError(f"Unknown embedding provider: {name}")
+
+
+class EmbeddingService(Embeddings):
+    """Single embedding path shared by SearchAgent and VectorStoreManager.
+
+    Uses one provider, model and output dimension per service, so vectors
+    computed while scoring search results can be stored in the vector store
+    as-is. Requests are batched and served from the shared embedding cache
+    where possible.
+    """
+
+    BATCH_SIZE = 64  # inputs per embeddings request
+
+    def __init__(
+        self,
+        provider: Optional[EmbeddingProvider] = None,
+        cache: Optional[EmbeddingCache] = None,
+        max_concurrency: int = EmbeddingConfig.MAX_CONCURRENCY
+    ):
+        self.provider = provider or AzureEmbeddingProvider()
+        self.model = self.provider.model
+        self.dimensions = self.provider.dimensions
+        self.cache = cache or get_embedding_cache()
+        self.max_concurrency = max_concurrency
+        # One semaphore per event loop; asyncio primitives cannot be shared across loops
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def embed_matrix(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a ``(len(texts), dimensions)`` float32 matrix.
+
+        Texts already in the cache are not sent and the rest go out in chunked
+        list requests. Rows whose embedding could not be computed are left as
+        NaN so a single bad entry never drops the rest of the batch.
+        """
+        matrix, pending = self._from_cache(texts)
+        for start in range(0, len(pending), self.BATCH_SIZE):
+            chunk = pending[start:start + self.BATCH_SIZE]
+            try:
+                matrix[chunk] = self.provider.embed_batch([texts[i] for i in chunk])
+            except resilience.CircuitOpenError as e:
+                # Per-item retries would only fast-fail too; leave the rows as NaN
+                logger.error(f"Skipping {len(chunk)} inputs: {str(e)}")
+            except Exception as e:
+                logger.error(f"Batch embedding of {len(chunk)} inputs failed, retrying individually: {str(e)}")
+                for i in chunk:
+                    try:
+                        matrix[i] = self.provider.embed_batch([texts[i]])[0]
+                    except resilience.CircuitOpenError as e:
+                        logger.error(f"Stopping individual retries: {str(e)}")
+                        break
+                    except Exception as e:
+                        logger.error(f"Embedding failed: {str(e)}")
+            self._store(texts, matrix, chunk)
+
+        self._log_failures(matrix)
+        return matrix
+
+    async def aembed_matrix(self, texts: List[str]) -> np.ndarray:
+        """Async ``embed_matrix``: chunks are requested concurrently, at most
+        ``max_concurrency`` at a time per event loop. Cache reads and writes
+        (SQLite, fsync) run in worker threads so they do not block the loop."""
+        matrix, pending = await asyncio.to_thread(self._from_cache, texts)
+        chunks = [pending[start:start + self.BATCH_SIZE] for start in range(0, len(pending), self.BATCH_SIZE)]
+        await asyncio.gather(*(self._aembed_chunk(texts, matrix, chunk) for chunk in chunks))
+        self._log_failures(matrix)
+        return matrix
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._checked(self.embed_matrix(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._checked(await self.aembed_matrix(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    async def _aembed_chunk(self, texts: List[str], matrix: np.ndarray, chunk: List[int]):
+        async with self._semaphore():
+            try:
+                matrix[chunk] = await self.provider.aembed_batch([texts[i] for i in chunk])
+            except resilience.CircuitOpenError as e:
+                logger.error(f"Skipping {len(chunk)} inputs: {str(e)}")
+            except Exception as e:
+                logger.error(f"Batch embedding of {len(chunk)} inputs failed, retrying individually: {str(e)}")
+                for i in chunk:
+                    try:
+                        matrix[i] = (await self.provider.aembed_batch([texts[i]]))[0]
+                    except resilience.CircuitOpenError as e:
+                        logger.error(f"Stopping individual retries: {str(e)}")
+                        break
+                    except Exception as e:
+                        logger.error(f"Embedding failed: {str(e)}")
+        await asyncio.to_thread(self._store, texts, matrix, chunk)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
+    def _from_cache(self, texts: List[str]):
+        """Matrix pre-filled from the cache, plus the indices that still need a request."""
+        matrix = np.full((len(texts), self.dimensions), np.nan, dtype=np.float32)
+        if self.provider.cacheable:
+            for i, vector in enumerate(self.cache.get_many(self.model, self.dimensions, texts)):
+                if vector is not None:
+                    matrix[i] = vector
+        # Empty strings are rejected by the embeddings API and would fail the whole chunk
+        pending = [
+            i for i, text in enumerate(texts)
+            if np.isnan(matrix[i, 0]) and text and text.strip()
+        ]
+        return matrix, pending
+
+    def _store(self, texts: List[str], matrix: np.ndarray, chunk: List[int]):
+        if not self.provider.cacheable:
+            return
+        embedded = [i for i in chunk if not np.isnan(matrix[i, 0])]
+        self.cache.put_many(
+            self.model, self.dimensions,
+            [texts[i] for i in embedded], [matrix[i] for i in embedded]
+        )
+
+    @staticmethod
+    def _log_failures(matrix: np.ndarray):
+        failed = int(np.isnan(matrix[:, 0]).sum()) if len(matrix) else 0
+        if failed:
+            logger.warning(f"Could not embed {failed} of {len(matrix)} inputs")
+
+    @staticmethod
+    def _checked(matrix: np.ndarray) -> List[List[float]]:
+        failed = int(np.isnan(matrix[:, 0]).sum()) if len(matrix) else 0
+        if failed:
+            raise RuntimeError(f"Failed to embed {failed} of {len(matrix)} documents")
+        return matrix.tolist()
+
+
+def get_embedding_service(provider: str = EmbeddingConfig.PROVIDER) -> EmbeddingService:
+    """Return the process-wide embedding service for ``provider`` ("azure" or "local")."""
+    return shared(("embedding-service", provider), lambda: _create_service(provider))
+
+
+def _create_service(provider: str) -> EmbeddingService:
+    service = EmbeddingService(create_provider(provider))
+    logger.info(
+        f"EmbeddingService initialized with {provider} provider, model {service.model} "
+        f"({service.dimensions} dims)"
+    )
+    return service
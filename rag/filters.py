@@ -0,0 +1,123 @@
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+DATE_PATTERN = re.compile(r"(\d{4})(?:-(\d{2}))?(?:-(\d{2}))?")
+
+# Keys accepted by VectorStoreManager.similarity_search(filters=...)
+FILTER_KEYS = ("published_from", "published_to", "authors", "sources")
+
+
+def published_timestamp(value, end: bool = False) -> Optional[int]:
+    """Unix seconds (UTC) for a date-like value.
+
+    Accepts datetimes, dates, years and ISO strings. A partial date like
+    "2024" or "2024-05" maps to the start of that period, or to its last
+    second with ``end``, so ``published_to="2024"`` includes all of 2024.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        moment = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return int(moment.timestamp())
+    if isinstance(value, date):
+        value = value.isoformat()
+
+    text = str(value).strip()
+    match = DATE_PATTERN.fullmatch(text)
+    if match:
+        year, month, day = int(match.group(1)), match.group(2), match.group(3)
+        if day:
+            start = datetime(year, int(month), int(day), tzinfo=timezone.utc)
+            following = start + timedelta(days=1)
+        elif month:
+            start = datetime(year, int(month), 1, tzinfo=timezone.utc)
+            following = datetime(year + int(month) // 12, int(month) % 12 + 1, 1, tzinfo=timezone.utc)
+        else:
+            start = datetime(year, 1, 1, tzinfo=timezone.utc)
+            following = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+        return int((following - timedelta(seconds=1) if end else start).timestamp())
+    return published_timestamp(datetime.fromisoformat(text.replace("Z", "+00:00")))
+
+
+def author_token(name: str) -> str:
+    """Normalized author key: lowercased with whitespace collapsed."""
+    return " ".join(str(name).lower().split())
+
+
+def source_name(doc: Dict) -> str:
+    """Short source label: the document's ``source`` field, else its URL's domain."""
+    source = str(doc.get("source", "") or "").strip().lower()
+    if source:
+        return source
+    domain = urlparse(str(doc.get("url", "") or "")).netloc.lower()
+    return domain[4:] if domain.startswith("www.") else domain
+
+
+def normalize_filters(filters: Optional[Dict]) -> Optional[Dict]:
+    """Validate a filter dict and convert it to stored representations.
+
+    Returns ``None`` when no predicate is set. Dates become Unix seconds and
+    authors and sources become lowercase keys; a document must match every
+    given field, and any one of the listed authors or sources.
+    """
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter keys: {sorted(unknown)}")
+    normalized = {
+        "published_from": published_timestamp(filters.get("published_from")),
+        "published_to": published_timestamp(filters.get("published_to"), end=True),
+        "authors": _as_list(filters.get("authors"), author_token),
+        "sources": _as_list(filters.get("sources"), lambda source: str(source).strip().lower())
+    }
+    normalized = {key: value for key, value in normalized.items() if value not in (None, [])}
+    return normalized or None
+
+
+def to_chroma_where(filters: Optional[Dict]) -> Optional[Dict]:
+    """Chroma ``where`` clause for normalized filters."""
+    if not filters:
+        return None
+    clauses = []
+    if "published_from" in filters:
+        clauses.append({"published": {"$gte": filters["published_from"]}})
+    if "published_to" in filters:
+        clauses.append({"published": {"$lte": filters["published_to"]}})
+    if "authors" in filters:
+        authors = [{"author_tokens": {"$contains": author}} for author in filters["authors"]]
+        clauses.append(authors[0] if len(authors) == 1 else {"$or": authors})
+    if "sources" in filters:
+        clauses.append({"source_name": {"$in": filters["sources"]}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _as_list(value, normalize) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    return sorted({normalize(item) for item in value if str(item).strip()})
+
+
+def matches_filters(metadata: Dict, filters: Optional[Dict]) -> bool:
+    """Whether stored ``metadata`` satisfies normalized ``filters``; used where
+    predicates cannot be pushed into an index."""
+    if not filters:
+        return True
+    published = metadata.get("published")
+    if "published_from" in filters and (published is None or published < filters["published_from"]):
+        return False
+    if "published_to" in filters and (published is None or published > filters["published_to"]):
+        return False
+    if "sources" in filters and metadata.get("source_name") not in filters["sources"]:
+        return False
+    if "authors" in filters:
+        authors = metadata.get("authors") or []
+        if isinstance(authors, str):  # Comma-joined legacy metadata
+            authors = authors.split(",")
+        if not {author_token(author) for author in authors} & set(filters["authors"]):
+            return False
+    return True
@@ -0,0 +1,26 @@
+import hashlib
+from typing import Dict, List, Sequence
+
+from langchain_core.documents import Document
+
+
+def document_key(doc: Document) -> str:
+    """Identity used to deduplicate results across searches."""
+    if doc.id:
+        return doc.id
+    source = doc.metadata.get("source") if doc.metadata else None
+    return source or hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Document]], k: int = 60,
+                           limit: int = None) -> List[Document]:
+    """Merge ranked lists by summing ``1 / (k + rank)``; each document appears once."""
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, doc)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in fused[:limit]]
@@ -0,0 +1,113 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List
+
+from config import IngestConfig
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class IngestionQueue:
+    """Bounded write-behind queue in front of ``VectorStoreManager.add_documents``.
+
+    Requests hand documents to ``submit`` and return immediately; a
+    background worker drains the queue into batches of up to ``batch_size``
+    (waiting at most ``flush_interval`` to fill one), keeps only the last
+    copy of each document ID and writes the batch with one bulk upsert.
+    When the queue is full for ``submit_timeout`` the caller's documents are
+    written inline, so a slow store pushes back instead of growing memory.
+    """
+
+    def __init__(self, vector_store, max_pending: int = IngestConfig.MAX_PENDING,
+                 batch_size: int = IngestConfig.BATCH_SIZE,
+                 flush_interval: float = IngestConfig.FLUSH_INTERVAL_SECONDS,
+                 submit_timeout: float = IngestConfig.SUBMIT_TIMEOUT_SECONDS):
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.submit_timeout = submit_timeout
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "written": 0, "coalesced": 0, "batches": 0, "inline": 0, "failed": 0}
+        self._worker = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, documents: List[Dict]):
+        """Queue ``documents`` for the next batch."""
+        documents = [doc for doc in documents if isinstance(doc, dict) and doc.get("content")]
+        for i, doc in enumerate(documents):
+            try:
+                self._queue.put(doc, timeout=self.submit_timeout)
+            except queue.Full:
+                rest = documents[i:]
+                logger.warning(f"Ingestion queue full, writing {len(rest)} documents inline")
+                self.vector_store.add_documents(rest)
+                self._count(inline=len(rest))
+                break
+            self._count(submitted=1)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until every queued document is written; False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 30.0):
+        """Write what is queued and stop the worker."""
+        if self._stop.is_set():
+            return
+        self.flush(timeout)
+        self._stop.set()
+        self._worker.join(timeout=self.flush_interval + 1)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {**self._stats, "pending": self._queue.qsize()}
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            taken = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(taken) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    taken.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(taken)
+
+    def _write(self, taken: List[Dict]):
+        # Last copy of a document wins, as in add_documents
+        batch = list({self.vector_store._document_id(doc): doc for doc in taken}.values())
+        try:
+            counts = self.vector_store.add_documents(batch)
+            self._count(written=len(batch), coalesced=len(taken) - len(batch), batches=1)
+            logger.info(f"Write-behind batch of {len(batch)} documents ({len(taken)} queued): {counts}")
+        except Exception as e:
+            self._count(failed=len(batch))
+            logger.error(f"Write-behind batch of {len(batch)} documents failed: {str(e)}")
+        finally:
+            for _ in taken:
+                self._queue.task_done()
+
+    def _count(self, **deltas: int):
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self._stats[key] += delta
@@ -0,0 +1,109 @@
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in into is it its of on or that the their this to was
+were will with we our these those which via using based than also can not
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens with stopwords removed; keeps tickers like ``gpt-4`` or ``3.5`` intact."""
+    return [token for token in TOKEN_PATTERN.findall((text or "").lower()) if token not in STOPWORDS]
+
+
+def bm25_scores(query: str, documents: List[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """Okapi BM25 score of every document against ``query``.
+
+    Statistics come from ``documents`` alone, so this is meant for ranking a
+    candidate set in-process (e.g. one arXiv result page) without an index.
+    """
+    scores = np.zeros(len(documents), dtype=np.float32)
+    query_terms = set(tokenize(query))
+    if not documents or not query_terms:
+        return scores
+
+    term_counts = [Counter(tokenize(doc)) for doc in documents]
+    lengths = np.array([sum(counts.values()) for counts in term_counts], dtype=np.float32)
+    average_length = float(lengths.mean()) or 1.0
+    norm = k1 * (1 - b + b * lengths / average_length)
+
+    for term in query_terms:
+        tf = np.array([counts.get(term, 0) for counts in term_counts], dtype=np.float32)
+        df = int((tf > 0).sum())
+        if not df:
+            continue
+        idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+        scores += idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+class LexicalIndex:
+    """Persistent BM25 inverted index over stored documents, kept in sync by
+    ``VectorStoreManager.add_documents``.
+
+    Backed by SQLite FTS5. Text is run through ``tokenize`` before indexing,
+    and FTS5 is told to keep ``-`` and ``.``, so tickers and model names such
+    as ``gpt-4`` match as whole terms.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS ids (id TEXT PRIMARY KEY);
+            CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5(body, tokenize="unicode61 tokenchars '-.'");
+        """)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ids").fetchone()[0]
+
+    def upsert(self, ids: List[str], texts: List[str]):
+        with self._lock, self._conn:
+            for doc_id, text in zip(ids, texts):
+                self._conn.execute("INSERT OR IGNORE INTO ids (id) VALUES (?)", (doc_id,))
+                rowid = self._conn.execute("SELECT rowid FROM ids WHERE id = ?", (doc_id,)).fetchone()[0]
+                self._conn.execute("DELETE FROM terms WHERE rowid = ?", (rowid,))
+                self._conn.execute("INSERT INTO terms (rowid, body) VALUES (?, ?)", (rowid, " ".join(tokenize(text))))
+
+    def delete(self, ids: List[str]):
+        with self._lock, self._conn:
+            for doc_id in ids:
+                row = self._conn.execute("SELECT rowid FROM ids WHERE id = ?", (doc_id,)).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM terms WHERE rowid = ?", row)
+                    self._conn.execute("DELETE FROM ids WHERE rowid = ?", row)
+
+    def optimize(self):
+        """Merge FTS5 segments and reclaim space left by deleted documents."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT INTO terms (terms) VALUES ('optimize')")
+            self._conn.execute("VACUUM")
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Best ``k`` document IDs by BM25, as ``(id, score)`` with higher scores better."""
+        terms = sorted(set(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT ids.id, bm25(terms) AS score FROM terms JOIN ids ON ids.rowid = terms.rowid
+                   WHERE terms MATCH ? ORDER BY score LIMIT ?""",
+                (match, k)
+            ).fetchall()
+        # FTS5 reports BM25 negated so that ascending order is best-first
+        return [(doc_id, -score) for doc_id, score in rows]
@@ -0,0 +1,143 @@
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from config import MaintenanceConfig
+from rag.vector_store import ARXIV_ID_PATTERN, VectorStoreManager
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def run_maintenance(manager: VectorStoreManager, max_age_days: float = MaintenanceConfig.MAX_AGE_DAYS,
+                    max_documents: int = MaintenanceConfig.MAX_DOCUMENTS, dedup: bool = True,
+                    dry_run: bool = False) -> Dict:
+    """Deduplicate, evict and compact ``manager``'s store; returns a report.
+
+    Duplicates share an arXiv ID (e.g. stored under different URLs) or a
+    content hash; the copy under the canonical ID, else the most recently
+    used one, is kept. Documents unused (neither added nor retrieved) for
+    ``max_age_days`` are evicted, then the least recently used ones beyond
+    ``max_documents``. A zero limit disables that policy. Documents stored
+    before usage was tracked count as used when first seen here.
+    """
+    probes = _probe_vectors(manager, MaintenanceConfig.LATENCY_QUERIES)
+    before = _measure(manager, probes)
+
+    documents = _stored_documents(manager)
+    manager.usage.record_added(list(documents), overwrite=False)
+    last_used = manager.usage.last_used()
+
+    duplicates: List[str] = []
+    if dedup:
+        groups: Dict[str, List[str]] = {}
+        for doc_id, metadata in documents.items():
+            match = ARXIV_ID_PATTERN.search(metadata.get("source", "") or "")
+            key = f"arxiv:{match.group(1)}" if match else metadata["content_hash"]
+            groups.setdefault(key, []).append(doc_id)
+        for key, ids in groups.items():
+            if len(ids) > 1:
+                keep = key if key in ids else max(ids, key=lambda doc_id: last_used.get(doc_id, 0.0))
+                duplicates.extend(doc_id for doc_id in ids if doc_id != keep)
+    removed = set(duplicates)
+    remaining = sorted(
+        (doc_id for doc_id in documents if doc_id not in removed),
+        key=lambda doc_id: last_used.get(doc_id, 0.0)
+    )
+
+    expired: List[str] = []
+    if max_age_days > 0:
+        cutoff = time.time() - max_age_days * 86400
+        expired = [doc_id for doc_id in remaining if last_used.get(doc_id, 0.0) < cutoff]
+        remaining = remaining[len(expired):]
+    over_cap = remaining[:max(0, len(remaining) - max_documents)] if max_documents > 0 else []
+
+    evicted = duplicates + expired + over_cap
+    report = {
+        "duplicates": len(duplicates), "expired": len(expired), "over_cap": len(over_cap),
+        "dry_run": dry_run, "before": before
+    }
+    if dry_run:
+        return report
+    if evicted:
+        manager.delete_documents(evicted)
+    report["compaction"] = manager.compact()
+    report["after"] = _measure(manager, probes)
+    logger.info(
+        f"Maintenance evicted {len(evicted)} documents; disk {before['disk_bytes']} -> "
+        f"{report['after']['disk_bytes']} bytes, p50 search {before['search_ms_p50']} -> "
+        f"{report['after']['search_ms_p50']} ms"
+    )
+    return report
+
+
+def _stored_documents(manager: VectorStoreManager) -> Dict[str, Dict]:
+    """Metadata per stored document; chunks beyond the first are folded into their parent.
+
+    Entries stored before content hashes were recorded get one computed from
+    their text, so duplicates among them are still found.
+    """
+    return {
+        doc.id: {**doc.metadata, "content_hash": doc.metadata.get("content_hash") or manager._content_hash(doc.page_content)}
+        for doc in manager._iter_stored_documents()
+        if not doc.metadata.get("chunk_index")
+    }
+
+
+def _probe_vectors(manager: VectorStoreManager, count: int) -> np.ndarray:
+    """Stored vectors used as queries, so latency is measured without embedding calls."""
+    if manager.backend == "mmap":
+        vectors, _ = manager.vector_store._snapshot()
+        if not len(vectors):
+            return np.zeros((0, manager.embeddings.dimensions), dtype=np.float32)
+        rows = np.random.default_rng(0).choice(len(vectors), size=min(count, len(vectors)), replace=False)
+        return np.asarray(vectors[np.sort(rows)], dtype=np.float32)
+    with manager._chroma_session():
+        found = manager.vector_store._collection.get(limit=count, include=["embeddings"])
+    return np.asarray(found["embeddings"], dtype=np.float32).reshape(-1, manager.embeddings.dimensions)
+
+
+def _measure(manager: VectorStoreManager, probes: np.ndarray, k: int = 10) -> Dict:
+    timings = []
+    for query in probes:
+        start = time.perf_counter()
+        if manager.backend == "mmap":
+            manager.vector_store.search(query, k=k)
+        else:
+            with manager._chroma_session():
+                manager.vector_store._collection.query(query_embeddings=[query.tolist()], n_results=k)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "entries": manager.count_entries(),
+        "disk_bytes": sum(path.stat().st_size for path in Path(manager.persist_dir).rglob("*") if path.is_file()),
+        "search_ms_p50": round(float(np.percentile(timings, 50)), 3) if timings else None,
+        "search_ms_p95": round(float(np.percentile(timings, 95)), 3) if timings else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate, evict and compact the vector store")
+    parser.add_argument("--backend", choices=["chroma", "mmap"], default=None)
+    parser.add_argument("--max-age-days", type=float, default=MaintenanceConfig.MAX_AGE_DAYS,
+                        help="Evict documents not added or retrieved for this many days (0 = off)")
+    parser.add_argument("--max-documents", type=int, default=MaintenanceConfig.MAX_DOCUMENTS,
+                        help="Evict least recently used documents beyond this count (0 = off)")
+    parser.add_argument("--no-dedup", action="store_true")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be evicted without changing the store")
+    args = parser.parse_args()
+
+    manager = VectorStoreManager(backend=args.backend) if args.backend else VectorStoreManager()
+    report = run_maintenance(
+        manager, max_age_days=args.max_age_days, max_documents=args.max_documents,
+        dedup=not args.no_dedup, dry_run=args.dry_run
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config import AnnIndexConfig, VectorStoreConfig
+from rag.ann_index import AnnIndex, recall_at_k
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DOCUMENT_COLUMNS = (
+    "id, row, content_hash, source, title, authors, content, published, source_name, "
+    "parent_id, chunk_index, chunk_count"
+)
+# Optional metadata columns, returned only when set
+OPTIONAL_COLUMNS = ("published", "source_name", "parent_id", "chunk_index", "chunk_count")
+
+
+class MmapVectorStore:
+    """Flat vector store: L2-normalized float32 rows in a memory-mapped file
+    plus a SQLite sidecar for IDs, metadata and text.
+
+    Vectors are only ever appended and are mapped read-only, so any number of
+    worker processes share one copy of the pages through the OS page cache and
+    opening a store costs the same for ten vectors or ten million. Updated
+    documents get a new row and their old row is tombstoned; writers are
+    serialized by the sidecar's write lock. Publication date, source and
+    author tokens are indexed columns in the sidecar, so filtered searches
+    select matching rows there before any vector is scored.
+
+    Tombstoned rows stay in the file until ``compact`` rewrites it into a new
+    generation; readers switch files when the sidecar's generation changes.
+
+    Search is exact unless an ANN index has been built with ``build_index``
+    (or ``python -m rag.ann_index build``).
+    """
+
+    SEARCH_CHUNK_ROWS = 65536  # Rows scored per matmul, bounds temporary memory
+
+    def __init__(self, directory: str, dimensions: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dimensions = dimensions
+        self._row_bytes = dimensions * 4
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.directory / "meta.db", check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                row INTEGER UNIQUE NOT NULL,
+                content_hash TEXT,
+                source TEXT,
+                title TEXT,
+                authors TEXT,
+                content TEXT,
+                published INTEGER,
+                source_name TEXT,
+                parent_id TEXT,
+                chunk_index INTEGER,
+                chunk_count INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS document_authors (author TEXT NOT NULL, row INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS deleted (row INTEGER PRIMARY KEY);
+        """)
+        self._conn.executescript("""
+            CREATE INDEX IF NOT EXISTS documents_published ON documents (published);
+            CREATE INDEX IF NOT EXISTS documents_source_name ON documents (source_name);
+            CREATE INDEX IF NOT EXISTS document_authors_author ON document_authors (author, row);
+            CREATE INDEX IF NOT EXISTS document_authors_row ON document_authors (row);
+        """)
+        self._conn.execute("INSERT OR IGNORE INTO info VALUES ('dimensions', ?)", (dimensions,))
+        self._conn.execute("INSERT OR IGNORE INTO info VALUES ('rows', 0)")
+        self._conn.execute("INSERT OR IGNORE INTO info VALUES ('version', 0)")
+        self._conn.execute("INSERT OR IGNORE INTO info VALUES ('generation', 0)")
+        self._vectors_file(self._info("generation")).touch(exist_ok=True)
+        self._remove_old_generations()
+        stored = self._info("dimensions")
+        if stored != dimensions:
+            raise ValueError(f"Store at {self.directory} holds {stored}-dim vectors, not {dimensions}")
+        self._vectors: Optional[np.ndarray] = None
+        self._mapped_rows = 0
+        self._mapped_generation = -1
+        self._version = -1
+        self._deleted = np.zeros(0, dtype=np.int64)
+        self.index: Optional[AnnIndex] = None
+        self._index_mtime = None
+        self._load_index()
+        logger.info(f"MmapVectorStore opened at {self.directory} with {self._info('rows')} vector rows")
+
+    def count(self) -> int:
+        """Number of live documents."""
+        return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def get_metadata(self, ids: Sequence[str]) -> Dict[str, Dict]:
+        """Stored metadata for the given IDs that exist."""
+        return {doc.id: doc.metadata for doc in self.get_documents(ids)}
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict], documents: List[str]):
+        """Append vectors for ``ids`` and point their metadata at the new rows."""
+        if not ids:
+            return
+        matrix = self._normalized(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._info("rows")
+                # Drop rows appended by a writer that died before committing
+                with open(self._vectors_file(self._info("generation")), "r+b") as f:
+                    f.truncate(rows * self._row_bytes)
+                    f.seek(0, os.SEEK_END)
+                    f.write(matrix.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                replaced = self._conn.execute(
+                    f"SELECT row FROM documents WHERE id IN ({','.join('?' * len(ids))})", ids
+                ).fetchall()
+                self._conn.executemany("INSERT OR IGNORE INTO deleted VALUES (?)", replaced)
+                self._conn.executemany("DELETE FROM document_authors WHERE row = ?", replaced)
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO documents ({DOCUMENT_COLUMNS}) VALUES ({','.join('?' * 12)})",
+                    [
+                        (doc_id, rows + i, metadata.get("content_hash", ""), metadata.get("source", ""),
+                         metadata.get("title", ""), json.dumps(list(metadata.get("authors", []))), text,
+                         *(metadata.get(column) for column in OPTIONAL_COLUMNS))
+                        for i, (doc_id, metadata, text) in enumerate(zip(ids, metadatas, documents))
+                    ]
+                )
+                self._conn.executemany(
+                    "INSERT INTO document_authors VALUES (?, ?)",
+                    [
+                        (author, rows + i)
+                        for i, metadata in enumerate(metadatas)
+                        for author in metadata.get("author_tokens", [])
+                    ]
+                )
+                self._conn.execute("UPDATE info SET value = ? WHERE key = 'rows'", (rows + len(ids),))
+                self._conn.execute("UPDATE info SET value = value + 1 WHERE key = 'version'")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, ids: List[str]):
+        """Remove documents; their vector rows are tombstoned until the store is compacted."""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._conn.execute(
+                    f"SELECT row FROM documents WHERE id IN ({','.join('?' * len(ids))})", ids
+                ).fetchall()
+                self._conn.executemany("INSERT OR IGNORE INTO deleted VALUES (?)", removed)
+                self._conn.executemany("DELETE FROM document_authors WHERE row = ?", removed)
+                self._conn.executemany("DELETE FROM documents WHERE row = ?", removed)
+                self._conn.execute("UPDATE info SET value = value + 1 WHERE key = 'version'")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def compact(self) -> Dict[str, int]:
+        """Rewrite the vectors without tombstoned rows and renumber the sidecar.
+
+        The live rows go to a new generation file that the sidecar switches to
+        on commit, so a crash at any point leaves a consistent store. An ANN
+        index refers to the old row numbers: it is dropped in the same
+        transaction and rebuilt with its kind and parameters afterwards.
+        """
+        with self._lock:
+            self._load_index()
+            previous = (self.index.kind, dict(self.index.params)) if self.index else None
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._info("rows")
+                generation = self._info("generation")
+                live = [row for (row,) in self._conn.execute("SELECT row FROM documents ORDER BY row")]
+                if len(live) == rows:
+                    self._conn.execute("ROLLBACK")
+                    return {"rows_before": rows, "rows_after": rows}
+                target = self._vectors_file(generation + 1)
+                with open(target, "wb") as f:
+                    if rows:
+                        source = np.memmap(self._vectors_file(generation), dtype=np.float32, mode="r",
+                                           shape=(rows, self.dimensions))
+                        for start in range(0, len(live), self.SEARCH_CHUNK_ROWS):
+                            f.write(np.ascontiguousarray(source[live[start:start + self.SEARCH_CHUNK_ROWS]]).tobytes())
+                        del source
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                # Renumber through negative rows so the UNIQUE constraint never sees a collision
+                remap = [(-1 - new, old) for new, old in enumerate(live)]
+                self._conn.executemany("UPDATE documents SET row = ? WHERE row = ?", remap)
+                self._conn.executemany("UPDATE document_authors SET row = ? WHERE row = ?", remap)
+                self._conn.execute("UPDATE documents SET row = -1 - row")
+                self._conn.execute("UPDATE document_authors SET row = -1 - row")
+                self._conn.execute("DELETE FROM deleted")
+                if previous:
+                    AnnIndex.remove(self.directory)
+                self._conn.execute("UPDATE info SET value = ? WHERE key = 'rows'", (len(live),))
+                self._conn.execute("UPDATE info SET value = value + 1 WHERE key = 'generation'")
+                self._conn.execute("UPDATE info SET value = value + 1 WHERE key = 'version'")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._remove_old_generations()
+            self._load_index()
+        logger.info(f"Compacted {self.directory} from {rows} to {len(live)} vector rows")
+        if previous and live:
+            self.build_index(previous[0], **previous[1])
+        return {"rows_before": rows, "rows_after": len(live)}
+
+    def build_index(self, kind: str = AnnIndexConfig.KIND, recall_k: int = 10,
+                    recall_queries: int = AnnIndexConfig.RECALL_QUERIES, **params) -> AnnIndex:
+        """(Re)build the ANN index over all committed rows, check its recall@k
+        against exact search and publish it to other processes."""
+        vectors, _ = self._snapshot()
+        if not len(vectors):
+            raise ValueError("Cannot build an index over an empty store")
+        index = AnnIndex.build(vectors, kind, **params)
+        index.report = recall_at_k(index, vectors, k=recall_k, num_queries=recall_queries)
+        logger.info(f"Index recall check: {index.report}")
+        with self._lock:
+            index.save(self.directory)
+            self._conn.execute("UPDATE info SET value = value + 1 WHERE key = 'version'")
+            self._load_index()
+        return self.index
+
+    def drop_index(self):
+        with self._lock:
+            AnnIndex.remove(self.directory)
+            self._conn.execute("UPDATE info SET value = value + 1 WHERE key = 'version'")
+            self._load_index()
+
+    def search(self, query_vector: Sequence[float], k: int = 10,
+               filters: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """Cosine search; returns ``(document, score)`` pairs, best first.
+
+        ``filters`` are normalized filters (see ``rag.filters.normalize_filters``).
+        """
+        return self.search_batch(np.asarray(query_vector, dtype=np.float32)[None, :], k, filters)[0]
+
+    def search_batch(self, query_vectors: np.ndarray, k: int = 10,
+                     filters: Optional[Dict] = None) -> List[List[Tuple[Document, float]]]:
+        """``search`` for a matrix of queries: one ANN probe or one matrix product
+        per chunk of rows for all of them, and one sidecar lookup."""
+        queries = self._normalized(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        vectors, deleted = self._snapshot()
+        allowed = self._filtered_rows(filters, len(vectors)) if filters else None
+        if not len(vectors) or k <= 0 or (allowed is not None and not len(allowed)):
+            return [[] for _ in queries]
+        top = self._top_rows(vectors, deleted, queries, k, allowed)
+        documents = self._documents_by_row(sorted({int(row) for rows, _ in top for row in rows}))
+        return [
+            [(documents[row], float(score)) for row, score in zip(rows.tolist(), scores.tolist()) if row in documents]
+            for rows, scores in top
+        ]
+
+    def _top_rows(self, vectors: np.ndarray, deleted: np.ndarray, queries: np.ndarray, k: int,
+                  allowed: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Best ``k`` live ``(rows, scores)`` per query: ANN over indexed rows,
+        exact over the unindexed tail.
+
+        With ``allowed`` (live rows matching a filter, sorted) only those rows
+        are candidates. Small sets are scored exactly; larger ones are passed
+        to the ANN index as an ID selector, and queries that still come back
+        short fall back to exact scoring so filtered results keep ``k`` hits.
+        """
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        start = 0
+        index = self.index
+        if allowed is not None and len(allowed) <= VectorStoreConfig.FILTER_EXACT_MAX_ROWS:
+            index = None
+        if index is not None:
+            indexed = allowed[allowed < index.rows] if allowed is not None else None
+            # Over-fetch so tombstoned rows do not leave the result short, within a bound;
+            # many tombstones call for compact() rather than ever larger fetches
+            fetch = k if allowed is not None else k + min(len(deleted), k * VectorStoreConfig.TOMBSTONE_OVERFETCH)
+            scores, rows = index.search(queries, fetch, vectors, indexed)
+            live = (rows >= 0) & ~np.isin(rows, deleted)
+            best_rows = rows.astype(np.int64)
+            best_scores = np.where(live, scores, -np.inf).astype(np.float32)
+            best_rows, best_scores = self._keep_top(best_rows, best_scores, k)
+            start = index.rows
+            if allowed is not None:
+                expected = min(k, len(indexed))
+            else:
+                expected = min(k, index.rows - int(np.count_nonzero(deleted < index.rows)))
+            if (np.isfinite(best_scores).sum(axis=1) < expected).any():
+                # Graph and IVF probes can miss selective filters, and capped fetches can
+                # come back all tombstones; rescore those rows exactly
+                if allowed is None:
+                    logger.warning(
+                        f"ANN results at {self.directory} were short after skipping {len(deleted)} "
+                        f"tombstoned rows; run compact() to drop them"
+                    )
+                best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+                best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+                start = 0
+
+        for rows, block in self._row_blocks(vectors, start, allowed):
+            scores = queries @ block.T
+            if len(deleted) and allowed is None:
+                scores[:, np.isin(rows, deleted)] = -np.inf
+            best_rows = np.concatenate([best_rows, np.broadcast_to(rows, scores.shape)], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows, best_scores = self._keep_top(best_rows, best_scores, k)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        return [(rows[np.isfinite(scores)], scores[np.isfinite(scores)]) for rows, scores in zip(best_rows, best_scores)]
+
+    def _row_blocks(self, vectors: np.ndarray, start: int, allowed: Optional[np.ndarray]):
+        """``(rows, vectors)`` blocks from ``start`` on, either contiguous or only ``allowed`` rows."""
+        if allowed is None:
+            for begin in range(start, len(vectors), self.SEARCH_CHUNK_ROWS):
+                block = np.asarray(vectors[begin:begin + self.SEARCH_CHUNK_ROWS])
+                yield np.arange(begin, begin + len(block)), block
+            return
+        allowed = allowed[allowed >= start]
+        for begin in range(0, len(allowed), self.SEARCH_CHUNK_ROWS):
+            rows = allowed[begin:begin + self.SEARCH_CHUNK_ROWS]
+            yield rows, np.asarray(vectors[rows])
+
+    def _filtered_rows(self, filters: Dict, row_count: int) -> np.ndarray:
+        """Sorted rows of live documents matching ``filters``, from the sidecar indexes."""
+        clauses, params = [], []
+        if "published_from" in filters:
+            clauses.append("published >= ?")
+            params.append(filters["published_from"])
+        if "published_to" in filters:
+            clauses.append("published <= ?")
+            params.append(filters["published_to"])
+        if "sources" in filters:
+            clauses.append(f"source_name IN ({','.join('?' * len(filters['sources']))})")
+            params.extend(filters["sources"])
+        if "authors" in filters:
+            clauses.append(
+                f"row IN (SELECT row FROM document_authors WHERE author IN ({','.join('?' * len(filters['authors']))}))"
+            )
+            params.extend(filters["authors"])
+        where = " AND ".join(clauses) or "1"
+        rows = np.array(
+            [row for (row,) in self._conn.execute(f"SELECT row FROM documents WHERE {where} ORDER BY row", params)],
+            dtype=np.int64
+        )
+        # Rows committed after the snapshot was mapped are not searchable yet
+        return rows[rows < row_count]
+
+    @staticmethod
+    def _keep_top(rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if scores.shape[1] <= k:
+            return rows, scores
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        return np.take_along_axis(rows, keep, axis=1), np.take_along_axis(scores, keep, axis=1)
+
+    def get_vectors(self, ids: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """The known IDs among ``ids``, in order, and their stored (normalized) vectors."""
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = list(ids[start:start + 500])
+            rows.update(self._conn.execute(
+                f"SELECT id, row FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        found = [doc_id for doc_id in ids if doc_id in rows]
+        vectors, _ = self._snapshot()
+        return found, np.array(vectors[[rows[doc_id] for doc_id in found]], dtype=np.float32).reshape(-1, self.dimensions)
+
+    def get_documents(self, ids: Sequence[str]) -> List[Document]:
+        """Documents for ``ids`` in the given order; unknown IDs are skipped."""
+        found = {}
+        for start in range(0, len(ids), 500):
+            chunk = list(ids[start:start + 500])
+            for row in self._conn.execute(
+                f"SELECT {DOCUMENT_COLUMNS} FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                found[row[0]] = self._document(row)
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Document]:
+        """All live documents in row order."""
+        last_row = -1
+        while True:
+            batch = self._conn.execute(
+                f"SELECT {DOCUMENT_COLUMNS} FROM documents WHERE row > ? ORDER BY row LIMIT ?", (last_row, batch_size)
+            ).fetchall()
+            if not batch:
+                return
+            for row in batch:
+                yield self._document(row)
+            last_row = batch[-1][1]
+
+    @staticmethod
+    def _document(row: Tuple) -> Document:
+        doc_id, _, content_hash, source, title, authors, content = row[:7]
+        try:
+            authors = json.loads(authors) if authors else []
+        except ValueError:
+            authors = [author.strip() for author in authors.split(",") if author.strip()]  # Comma-joined legacy rows
+        metadata = {"source": source, "title": title, "authors": authors, "content_hash": content_hash}
+        metadata.update({
+            column: value for column, value in zip(OPTIONAL_COLUMNS, row[7:]) if value not in (None, "")
+        })
+        return Document(page_content=content, metadata=metadata, id=doc_id)
+
+    def _documents_by_row(self, rows: List[int]) -> Dict[int, Document]:
+        """Documents for the rows still in the sidecar; rows replaced by a
+        concurrent writer since the snapshot are left out."""
+        found = {}
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            for row in self._conn.execute(
+                f"SELECT {DOCUMENT_COLUMNS} FROM documents WHERE row IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                found[row[1]] = self._document(row)
+        return found
+
+    def _snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Committed rows and tombstones, remapping only when another write landed."""
+        with self._lock:
+            try:
+                self._refresh_snapshot()
+            except FileNotFoundError:
+                # A compaction committed and removed the file between our read and the remap
+                self._refresh_snapshot()
+            vectors = self._vectors if self._vectors is not None else np.zeros((0, self.dimensions), np.float32)
+            return vectors, self._deleted
+
+    def _refresh_snapshot(self):
+        # One read transaction, so a concurrent compact() cannot mix generations
+        self._conn.execute("BEGIN")
+        try:
+            version = self._info("version")
+            if version == self._version:
+                return
+            rows = self._info("rows")
+            generation = self._info("generation")
+            if rows != self._mapped_rows or generation != self._mapped_generation:
+                self._vectors = (
+                    np.memmap(self._vectors_file(generation), dtype=np.float32, mode="r",
+                              shape=(rows, self.dimensions))
+                    if rows else None
+                )
+                self._mapped_rows = rows
+                self._mapped_generation = generation
+            self._deleted = np.array(
+                [row for (row,) in self._conn.execute("SELECT row FROM deleted")], dtype=np.int64
+            )
+            self._version = version
+            self._load_index()
+        finally:
+            self._conn.execute("COMMIT")
+
+    def _load_index(self):
+        """Pick up an index built by this or another process."""
+        meta = self.directory / AnnIndex.META_FILE
+        mtime = meta.stat().st_mtime_ns if meta.exists() else None
+        if mtime == self._index_mtime:
+            return
+        self._index_mtime = mtime
+        index = AnnIndex.load(self.directory)
+        if index is not None and index.rows > self._info("rows"):
+            logger.warning(f"Ignoring ANN index at {self.directory}: built for more rows than the store holds")
+            index = None
+        self.index = index
+
+    def _vectors_file(self, generation: int) -> Path:
+        return self.directory / ("vectors.f32" if generation == 0 else f"vectors.{generation}.f32")
+
+    def _remove_old_generations(self):
+        """Delete vector files superseded by a compaction; processes that still
+        map one keep reading it until they notice the new generation."""
+        current = self._info("generation")
+        for path in self.directory.glob("vectors*.f32"):
+            parts = path.name.split(".")
+            generation = int(parts[1]) if len(parts) == 3 and parts[1].isdigit() else 0
+            if generation < current:
+                path.unlink(missing_ok=True)
+
+    def _info(self, key: str) -> int:
+        return self._conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()[0]
+
+    @staticmethod
+    def _normalized(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms > 0, norms, 1.0)
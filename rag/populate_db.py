@@ -8,14 +8,18 @@ from pathlib import Path
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def save_papers(papers: list[dict], directory: str = "data/raw"):
+INGEST_BATCH_SIZE = 25  # papers per vector store write while streaming
+
+def save_papers(papers: list[dict], directory: str = "data/raw", start: int = 0):
     os.makedirs(directory, exist_ok=True)
-    for i, paper in enumerate(papers):
+    for i, paper in enumerate(papers, start=start):
         try:
             filename = f"paper_{i+1}.json"
             filepath = os.path.join(directory, filename)
+            # Search embeddings are only reused for indexing; they would bloat the raw files
+            record = {k: v for k, v in paper.items() if k != "embedding"}
             with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(paper, f, ensure_ascii=False, indent=2)
+                json.dump(record, f, ensure_ascii=False, indent=2)
             logger.info(f"Saved paper {i+1} to {filepath}")
         except Exception as e:
             logger.error(f"Failed to save paper {i+1}: {str(e)}")
@@ -36,42 +40,44 @@ def load_papers(directory: str = "data/raw") -> list[dict]:
 def main():
     vector_store = VectorStoreManager(persist_dir="data/vector_store")
     search_agent = SearchAgent()
-    query = "AI evolution 2024"
-    logger.info(f"Fetching 100 papers for query: {query}")
-    
-    # Fetch up to 100 papers
-    papers = search_agent.run(query=query, max_results=100)
-    
-    # If fewer than 100, try additional queries
-    if len(papers) < 100:
-        logger.warning(f"Fetched only {len(papers)} papers, attempting to fetch more...")
-        additional_queries = [
-            "artificial intelligence trends 2024",
-            "machine learning advancements 2024",
-            "deep learning evolution 2024"
-        ]
-        for additional_query in additional_queries:
-            if len(papers) >= 100:
-                break
-            remaining = 100 - len(papers)
-            additional_papers = search_agent.run(query=additional_query, max_results=remaining)
-            papers.extend([p for p in additional_papers if p not in papers])  # Avoid duplicates
-            logger.info(f"Fetched {len(additional_papers)} papers for query: {additional_query}")
-    
-    logger.info(f"Total papers fetched: {len(papers)}")
-    
-    # Save papers to data/raw/
-    save_papers(papers)
-    
-    # Load papers from data/raw/
-    loaded_papers = load_papers()
-    if not loaded_papers:
-        logger.error("No papers loaded from data/raw/")
+    queries = [
+        "AI evolution 2024",
+        # Used only if the main query yields fewer than 100 papers
+        "artificial intelligence trends 2024",
+        "machine learning advancements 2024",
+        "deep learning evolution 2024"
+    ]
+    target = 100
+    seen_urls = set()
+    batch = []
+    total = 0
+
+    def flush():
+        # Save and ingest each batch as it arrives instead of after the whole harvest
+        save_papers(batch, start=total - len(batch))
+        counts = vector_store.add_documents(batch)
+        logger.info(f"Added {len(batch)} papers to Chroma database: {counts}")
+        batch.clear()
+
+    for query in queries:
+        if total >= target:
+            break
+        logger.info(f"Fetching up to {target - total} papers for query: {query}")
+        for paper in search_agent.iter_results(query=query, max_results=target - total):
+            if paper.get("url") in seen_urls:
+                continue  # Avoid duplicates
+            seen_urls.add(paper.get("url"))
+            batch.append(paper)
+            total += 1
+            if len(batch) >= INGEST_BATCH_SIZE:
+                flush()
+    if batch:
+        flush()
+
+    if not total:
+        logger.error("No papers fetched")
         return
-    
-    # Add papers to Chroma
-    vector_store.add_documents(loaded_papers)
-    logger.info(f"Added {len(loaded_papers)} papers to Chroma database")
+    logger.info(f"Total papers fetched: {total}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
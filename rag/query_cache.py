@@ -0,0 +1,96 @@
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+from config import QueryCacheConfig
+
+
+class SemanticQueryCache:
+    """Results of recent queries, looked up by embedding similarity.
+
+    Query vectors live in one preallocated matrix, so a lookup is a single
+    matrix-vector product. A query whose cosine similarity to a cached one
+    reaches ``threshold`` gets that entry's results, provided the entry has
+    the same ``signature`` (mode, k, filters), is younger than ``ttl`` and
+    was stored at the collection's current ``revision``. When full, expired
+    or stale entries are reused first, then the least recently used one.
+    """
+
+    def __init__(self, dimensions: int, capacity: int = QueryCacheConfig.CAPACITY,
+                 threshold: float = QueryCacheConfig.SIMILARITY_THRESHOLD,
+                 ttl: float = QueryCacheConfig.TTL_SECONDS):
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+        self._used = np.zeros(capacity, dtype=bool)
+        self._created = np.zeros(capacity)
+        self._last_hit = np.zeros(capacity)
+        self._entries: list = [None] * capacity  # (signature, revision, results) per slot
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidated": 0}
+
+    def get(self, query_vector: np.ndarray, signature: Hashable, revision: int) -> Optional[Any]:
+        query = self._normalized(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            self._drop_dead(now, revision)
+            candidates = np.flatnonzero(self._used)
+            candidates = [slot for slot in candidates if self._entries[slot][0] == signature]
+            if candidates:
+                similarity = self._vectors[candidates] @ query
+                best = int(np.argmax(similarity))
+                if similarity[best] >= self.threshold:
+                    slot = candidates[best]
+                    self._last_hit[slot] = now
+                    self._stats["hits"] += 1
+                    return self._entries[slot][2]
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, query_vector: np.ndarray, signature: Hashable, revision: int, results: Any):
+        now = time.monotonic()
+        with self._lock:
+            self._drop_dead(now, revision)
+            free = np.flatnonzero(~self._used)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self._last_hit))
+                self._stats["evictions"] += 1
+            self._vectors[slot] = self._normalized(query_vector)
+            self._used[slot] = True
+            self._created[slot] = now
+            self._last_hit[slot] = now
+            self._entries[slot] = (signature, revision, results)
+
+    def clear(self):
+        with self._lock:
+            self._used[:] = False
+            self._entries = [None] * len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": int(self._used.sum()),
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0
+            }
+
+    def _drop_dead(self, now: float, revision: int):
+        """Free entries past their TTL or computed before the collection last changed."""
+        used = np.flatnonzero(self._used)
+        expired = used[now - self._created[used] > self.ttl]
+        stale = [slot for slot in used if now - self._created[slot] <= self.ttl and self._entries[slot][1] != revision]
+        for slot in [*expired.tolist(), *stale]:
+            self._used[slot] = False
+            self._entries[slot] = None
+        self._stats["expired"] += len(expired)
+        self._stats["invalidated"] += len(stale)
+
+    @staticmethod
+    def _normalized(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
@@ -48,29 +48,179 @@
 
 
 from rag.vector_store import VectorStoreManager
-from typing import List, Dict
+from utils.registry import get_vector_store, shared
+from rag.diversity import maximal_marginal_relevance
+from rag.filters import matches_filters, normalize_filters
+from rag.fusion import reciprocal_rank_fusion
+from rag.ingest_queue import IngestionQueue
+from rag.lexical import bm25_scores
+from rag.query_cache import SemanticQueryCache
+from config import IngestConfig, QueryCacheConfig, RetrievalConfig
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from typing import List, Dict, Optional, Tuple
+import json
 import logging
+import numpy as np
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Retriever:
-    def __init__(self):
-        self.vector_store = VectorStoreManager()
+    def __init__(self, mode: str = RetrievalConfig.MODE, vector_store: Optional[VectorStoreManager] = None):
+        if mode not in ("dense", "hybrid", "mmr"):
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        # The shared manager unless a specific store is given
+        self.vector_store = vector_store or get_vector_store()
+        self.mode = mode
+        # One write-behind queue per store, so batches coalesce across retrievers and requests
+        self.ingest_queue = (
+            shared(("ingest-queue", id(self.vector_store)), lambda: IngestionQueue(self.vector_store))
+            if IngestConfig.WRITE_BEHIND else None
+        )
+        # Paraphrases of recent queries reuse their results until the collection changes;
+        # one cache per store, so per-request retrievers share it
+        self.query_cache = (
+            shared(("query-cache", id(self.vector_store)),
+                   lambda: SemanticQueryCache(self.vector_store.embeddings.dimensions))
+            if QueryCacheConfig.ENABLED else None
+        )
+        # Runs the lexical and dense legs of hybrid retrieval side by side
+        self._executor = shared(
+            "retriever-executor", lambda: ThreadPoolExecutor(max_workers=4, thread_name_prefix="retriever")
+        )
 
-    def retrieve_relevant_info(self, query: str, context: Dict) -> List[Dict]:
+    def retrieve_relevant_info(self, query: str, context: Dict, k: int = RetrievalConfig.TOP_K) -> List[Dict]:
         if not query:
             logger.warning("Empty query provided")
             return []
-        # Add new documents if provided
-        if context.get("documents"):
-            logger.info(f"Adding {len(context['documents'])} documents")
-            self.vector_store.add_documents(context["documents"])
-        # Retrieve from existing database
-        results = self.vector_store.similarity_search(query)
+        fresh = context.get("documents") or []
+        # Add new documents if provided; with write-behind they are persisted in the background
+        if fresh and self.ingest_queue:
+            self.ingest_queue.submit(fresh)
+        elif fresh:
+            logger.info(f"Adding {len(fresh)} documents")
+            counts = self.vector_store.add_documents(fresh)
+            logger.info(f"Ingest counts: {counts}")
+        # Retrieve from existing database, optionally limited by context["filters"]
+        # (published_from / published_to / authors / sources)
+        filters = context.get("filters")
+        # The cache holds index results only; documents still queued for
+        # write-behind are merged in per request, hit or miss
+        cache_key = self._cache_key(query, k, filters) if self.query_cache else None
+        results = self.query_cache.get(*cache_key) if cache_key else None
+        if results is None:
+            if self.mode == "hybrid":
+                results = self._hybrid_search(query, k, filters)
+            elif self.mode == "mmr":
+                results = self._mmr_search(query, k, filters)
+            else:
+                results = self._dense_search(query, k, filters)
+            if cache_key:
+                self.query_cache.put(*cache_key, results)
+        else:
+            logger.info(f"Query cache hit for: {query}")
+        if fresh and self.ingest_queue:
+            results = self._merge_fresh(query, results, fresh, k, filters)
+        self.vector_store.record_retrieval(results)
         return [{
             "content": doc.page_content,
             "source": doc.metadata.get("source", ""),
             "title": doc.metadata.get("title", ""),
             "authors": doc.metadata.get("authors", [])
-        } for doc in results]
\ No newline at end of file
+        } for doc in results]
+
+    def _cache_key(self, query: str, k: int, filters: Optional[Dict]) -> Optional[Tuple]:
+        """``(query_vector, signature, revision)`` for the query cache, or None
+        when the query cannot be embedded. The query embedding is cached, so
+        the search that may follow does not embed it again."""
+        try:
+            query_vector = np.asarray(self.vector_store.embeddings.embed_query(query), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Query cache skipped, could not embed query: {str(e)}")
+            return None
+        if np.isnan(query_vector).any():
+            return None
+        signature = (self.mode, k, RetrievalConfig.EXPAND_QUERIES, json.dumps(normalize_filters(filters), sort_keys=True))
+        return query_vector, signature, self.vector_store.revision
+
+    def _hybrid_search(self, query: str, k: int, filters: Optional[Dict] = None) -> List[Document]:
+        """BM25 and vector search run concurrently, fused with reciprocal rank fusion.
+
+        Exact keyword hits (tickers, product names) rank high from the lexical
+        leg even when their embeddings are unremarkable, while the dense leg
+        keeps paraphrases and related work in the pool.
+        """
+        pool = max(k, RetrievalConfig.CANDIDATE_POOL)
+        lexical = self._executor.submit(self.vector_store.lexical_search, query, pool, filters)
+        dense = self._executor.submit(self._dense_search, query, pool, filters)
+        lexical_results, dense_results = lexical.result(), dense.result()
+        fused = reciprocal_rank_fusion([lexical_results, dense_results], k=RetrievalConfig.RRF_K, limit=k)
+        logger.info(
+            f"Hybrid retrieval fused {len(lexical_results)} lexical and {len(dense_results)} dense "
+            f"results into {len(fused)}"
+        )
+        return fused
+
+    def _merge_fresh(self, query: str, results: List[Document], fresh: List[Dict], k: int,
+                     filters: Optional[Dict] = None) -> List[Document]:
+        """Fuse the caller's not-yet-persisted documents into index results.
+
+        Fresh documents are ranked in memory: by cosine similarity when all
+        of them carry embeddings from SearchAgent (the query vector comes from
+        the embedding cache), else by BM25 over their text.
+        """
+        filters = normalize_filters(filters)
+        candidates = []
+        for doc in fresh:
+            if not isinstance(doc, dict) or not doc.get("content"):
+                continue
+            text = str(doc["content"])
+            metadata = self.vector_store._metadata(doc, self.vector_store._content_hash(text))
+            if matches_filters(metadata, filters):
+                candidate = Document(page_content=text, metadata=metadata, id=self.vector_store._document_id(doc))
+                candidates.append((candidate, self.vector_store._precomputed_embedding(doc)))
+        if not candidates:
+            return results
+
+        if all(embedding is not None for _, embedding in candidates):
+            vectors = np.asarray([embedding for _, embedding in candidates], dtype=np.float32)
+            query_vector = np.asarray(self.vector_store.embeddings.embed_query(query), dtype=np.float32)
+            scores = vectors @ query_vector / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        else:
+            scores = bm25_scores(query, [f"{doc.metadata['title']}\n{doc.page_content}" for doc, _ in candidates])
+        ranked = [candidates[i][0] for i in np.argsort(-scores, kind="stable")[:k]]
+        # Index results come first so persisted copies (and chunk excerpts) win on ties
+        return reciprocal_rank_fusion([results, ranked], k=RetrievalConfig.RRF_K, limit=k)
+
+    def _mmr_search(self, query: str, k: int, filters: Optional[Dict] = None) -> List[Document]:
+        """Dense retrieval diversified with maximal marginal relevance.
+
+        Near-duplicate abstracts (versions, surveys of the same work) crowd
+        the plain top-k; MMR re-picks ``k`` from a larger candidate pool using
+        the stored vectors, so it costs no extra embedding calls.
+        """
+        pool = max(k, RetrievalConfig.CANDIDATE_POOL)
+        try:
+            query_vector, candidates, vectors = self.vector_store.similarity_search_with_vectors(query, pool, filters)
+        except Exception as e:
+            logger.error(f"MMR retrieval failed, falling back to dense search: {str(e)}")
+            return self._dense_search(query, k, filters)
+        picks = maximal_marginal_relevance(query_vector, vectors, k, RetrievalConfig.MMR_LAMBDA)
+        logger.info(f"MMR selected {len(picks)} of {len(candidates)} candidates")
+        return [candidates[i] for i in picks]
+
+    def _dense_search(self, query: str, k: int, filters: Optional[Dict] = None) -> List[Document]:
+        if not RetrievalConfig.EXPAND_QUERIES:
+            return self.vector_store.similarity_search(query, k=k, filters=filters)
+        # All variants share one embedding request and one index probe
+        queries = [query] + self._generate_related_queries(query)
+        return self.vector_store.similarity_search_batch(queries, k=k, filters=filters)["fused"][:k]
+
+    def _generate_related_queries(self, query: str) -> List[str]:
+        """Related phrasings for query-expansion retrieval"""
+        return [
+            f"different perspectives on {query}",
+            f"recent developments in {query}",
+            f"statistical data about {query}"
+        ]
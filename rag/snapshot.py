@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import json
+import logging
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RAGSNAP1"
+FORMAT_VERSION = 1
+# Metadata fields stored as columns; anything else in a document's metadata is dropped
+METADATA_COLUMNS = (
+    "source", "title", "content_hash", "source_name", "authors", "author_tokens", "published",
+    "parent_id", "chunk_index", "chunk_count"
+)
+HASH_BLOCK_BYTES = 1 << 24
+
+# (ids, vectors, metadatas, texts) for a run of stored entries
+Batch = Tuple[List[str], np.ndarray, List[Dict], List[str]]
+
+
+def write_snapshot(path: str, batches: Iterable[Batch], model: str, dimensions: int) -> Dict:
+    """Write stored entries to one snapshot file and return its header.
+
+    Layout: ``MAGIC``, the header offset (uint64), all vectors as one
+    contiguous float32 array, the zlib-compressed JSON metadata columns,
+    then the JSON header with counts, offsets and a SHA-256 of everything
+    between the offset field and the header.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    columns: Dict[str, List] = {"id": [], "text": [], **{name: [] for name in METADATA_COLUMNS}}
+    count = 0
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", 0))
+        for ids, vectors, metadatas, texts in batches:
+            block = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, dimensions).tobytes()
+            f.write(block)
+            digest.update(block)
+            columns["id"].extend(ids)
+            columns["text"].extend(texts)
+            for name in METADATA_COLUMNS:
+                columns[name].extend(metadata.get(name) for metadata in metadatas)
+            count += len(ids)
+
+        blob = zlib.compress(json.dumps(columns, ensure_ascii=False).encode("utf-8"), 6)
+        f.write(blob)
+        digest.update(blob)
+        header = {
+            "format": FORMAT_VERSION, "model": model, "dimensions": dimensions, "count": count,
+            "vectors_offset": len(MAGIC) + 8, "columns_offset": len(MAGIC) + 8 + count * dimensions * 4,
+            "columns_bytes": len(blob), "sha256": digest.hexdigest()
+        }
+        header_offset = f.tell()
+        f.write(json.dumps(header).encode("utf-8"))
+        f.seek(len(MAGIC))
+        f.write(struct.pack("<Q", header_offset))
+    logger.info(f"Wrote snapshot of {count} entries to {path} ({path.stat().st_size} bytes)")
+    return header
+
+
+def read_header(path: str) -> Dict:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a vector store snapshot")
+        (header_offset,) = struct.unpack("<Q", f.read(8))
+        f.seek(header_offset)
+        header = json.loads(f.read().decode("utf-8"))
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {header.get('format')}")
+    return header
+
+
+def read_snapshot(path: str, batch_size: int = 5000) -> Tuple[Dict, Iterator[Batch]]:
+    """Header and batches of a snapshot, after verifying its checksum.
+
+    Vectors are memory-mapped, so batches are slices of the file rather than
+    copies of it.
+    """
+    header = read_header(path)
+    digest = hashlib.sha256()
+    end = header["columns_offset"] + header["columns_bytes"]
+    with open(path, "rb") as f:
+        f.seek(header["vectors_offset"])
+        remaining = end - header["vectors_offset"]
+        while remaining:
+            block = f.read(min(HASH_BLOCK_BYTES, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+        if digest.hexdigest() != header["sha256"]:
+            raise ValueError(f"Snapshot {path} failed its checksum; the file is truncated or corrupt")
+        f.seek(header["columns_offset"])
+        columns = json.loads(zlib.decompress(f.read(header["columns_bytes"])).decode("utf-8"))
+
+    count, dimensions = header["count"], header["dimensions"]
+    vectors = (
+        np.memmap(path, dtype=np.float32, mode="r", offset=header["vectors_offset"], shape=(count, dimensions))
+        if count else np.zeros((0, dimensions), dtype=np.float32)
+    )
+
+    def batches() -> Iterator[Batch]:
+        for start in range(0, count, batch_size):
+            stop = min(start + batch_size, count)
+            metadatas = [
+                {
+                    name: columns[name][i] for name in METADATA_COLUMNS
+                    if columns[name][i] is not None and columns[name][i] != []
+                }
+                for i in range(start, stop)
+            ]
+            yield columns["id"][start:stop], np.asarray(vectors[start:stop]), metadatas, columns["text"][start:stop]
+
+    return header, batches()
+
+
+def main():
+    from rag.vector_store import VectorStoreManager
+
+    parser = argparse.ArgumentParser(description="Export or import a vector store snapshot")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path")
+    parser.add_argument("--backend", choices=["chroma", "mmap"], default=None)
+    args = parser.parse_args()
+
+    manager = VectorStoreManager(backend=args.backend) if args.backend else VectorStoreManager()
+    if args.command == "export":
+        print(json.dumps(manager.export_snapshot(args.path), indent=2))
+    else:
+        print(json.dumps(manager.import_snapshot(args.path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
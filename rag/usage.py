@@ -0,0 +1,52 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+class UsageLog:
+    """When each stored document was added and last retrieved, used by
+    ``rag.maintenance`` for age-based and LRU eviction.
+
+    Kept beside the vector store rather than in its metadata so recording a
+    retrieval never rewrites a stored document.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage (id TEXT PRIMARY KEY, added REAL NOT NULL, retrieved REAL)"
+        )
+
+    def record_added(self, ids: List[str], overwrite: bool = True):
+        """Stamp ``ids`` as added now; without ``overwrite`` only IDs not yet logged are stamped."""
+        conflict = "DO UPDATE SET added = excluded.added" if overwrite else "DO NOTHING"
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO usage (id, added) VALUES (?, ?) ON CONFLICT(id) {conflict}",
+                [(doc_id, now) for doc_id in ids]
+            )
+
+    def record_retrieved(self, ids: List[str]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO usage (id, added, retrieved) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET retrieved = excluded.retrieved",
+                [(doc_id, now, now) for doc_id in ids]
+            )
+
+    def last_used(self) -> Dict[str, float]:
+        """Latest add or retrieval time per document."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT id, MAX(added, IFNULL(retrieved, 0)) FROM usage"))
+
+    def delete(self, ids: List[str]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM usage WHERE id = ?", [(doc_id,) for doc_id in ids])
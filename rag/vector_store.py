@@ -57,78 +57,754 @@
 #         return self.vector_store.similarity_search(query, k=k)
 
 import os
+import re
+import shutil
+import sqlite3
+import uuid
+import hashlib
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 import logging
+import numpy as np
+from chromadb.api.client import SharedSystemClient
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain_openai import AzureOpenAIEmbeddings
+from config import ChunkingConfig, EmbeddingConfig, RetrievalConfig, VectorStoreConfig
+from rag.chunking import TokenChunker, count_tokens, truncate_tokens
+from rag.embeddings import get_embedding_service
+from rag.filters import author_token, matches_filters, normalize_filters, published_timestamp, source_name, to_chroma_where
+from rag.fusion import reciprocal_rank_fusion
+from rag.lexical import LexicalIndex
+from rag.mmap_store import MmapVectorStore
+from rag.snapshot import Batch, read_snapshot, write_snapshot
+from rag.usage import UsageLog
+
+try:
+    import fcntl
+except ImportError:  # Windows: Chroma compaction is then not coordinated across processes
+    fcntl = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Metadata that filtered search depends on; a change to any of these rewrites the document
+FILTER_METADATA_FIELDS = ("published", "source_name", "authors")
+
+# Matches new-style (2401.12345v2) and old-style (hep-th/9901001) arXiv IDs in abs/pdf URLs
+ARXIV_ID_PATTERN = re.compile(r"arxiv\.org/(?:abs|pdf)/([a-z\-]+/\d{7}|\d{4}\.\d{4,5})(?:v\d+)?")
+
+# Chroma names segment directories after the segment UUID
+UUID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
 class VectorStoreManager:
-    def __init__(self, persist_dir: str = "data/vector_store"):
+    def __init__(self, persist_dir: str = VectorStoreConfig.PERSIST_DIR, backend: str = VectorStoreConfig.BACKEND):
         try:
-            required_vars = ["AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_KEY", "AZURE_EMBEDDING_DEPLOYMENT"]
-            missing_vars = [var for var in required_vars if not os.getenv(var)]
-            if missing_vars:
-                raise ValueError(f"Missing environment variables: {missing_vars}")
-
-            self.embeddings = AzureOpenAIEmbeddings(
-                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                api_version="2024-02-01",
-                azure_deployment=os.getenv("AZURE_EMBEDDING_DEPLOYMENT"),
-                model="text-embedding-3-large",
-                dimensions=1536
-            )
+            if EmbeddingConfig.RAG_PROVIDER == "azure":
+                required_vars = ["AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_KEY", "AZURE_EMBEDDING_DEPLOYMENT"]
+                missing_vars = [var for var in required_vars if not os.getenv(var)]
+                if missing_vars:
+                    raise ValueError(f"Missing environment variables: {missing_vars}")
+
+            # Same service as SearchAgent's relevance scoring when both use the same provider
+            self.embeddings = get_embedding_service(EmbeddingConfig.RAG_PROVIDER)
             self.persist_dir = Path(persist_dir)
-            self.collection_name = "market_research"
-            self.vector_store = Chroma(
-                collection_name=self.collection_name,
-                embedding_function=self.embeddings,
-                persist_directory=str(self.persist_dir)
+            # Vectors from different models are not comparable, so non-default models get their own collection
+            self.collection_name = (
+                "market_research" if self.embeddings.model == EmbeddingConfig.MODEL
+                else f"market_research__{self.embeddings.model}"
             )
-            logger.info(f"VectorStoreManager initialized with persist_dir: {self.persist_dir}")
+            self.backend = backend
+            self.chunker = TokenChunker()
+            # Bumped on every write in this process; lets result caches detect a changed collection
+            self.revision = 0
+            if backend == "chroma":
+                # Name of the live Chroma collection; compaction rebuilds into a new one and switches
+                self._active_file = self.persist_dir / f".{self.collection_name}.active"
+                # Touched by every delete and switch; other processes reopen Chroma when it changes
+                self._reopen_marker = self.persist_dir / f".{self.collection_name}.reopen"
+                self._reopen_stamp = self._marker_stamp()
+                self.vector_store = self._open_chroma()
+            elif backend == "mmap":
+                self.vector_store = MmapVectorStore(
+                    self.persist_dir / "mmap" / self.collection_name,
+                    self.embeddings.dimensions
+                )
+            else:
+                raise ValueError(f"Unknown vector store backend: {backend}")
+            # BM25 index over the same documents for hybrid retrieval
+            self.lexical_index = LexicalIndex(self.persist_dir / "lexical" / f"{backend}__{self.collection_name}.db")
+            if not self.lexical_index.count():
+                self._backfill_lexical_index()
+            # Add and retrieval times for maintenance eviction (python -m rag.maintenance)
+            self.usage = UsageLog(self.persist_dir / "usage" / f"{backend}__{self.collection_name}.db")
+            logger.info(f"VectorStoreManager initialized with {backend} backend, persist_dir: {self.persist_dir}")
 
         except Exception as e:
             logger.error(f"Initialization failed: {str(e)}")
             raise
 
-    def add_documents(self, documents: List[Dict]):
+    def add_documents(self, documents: List[Dict], upsert: bool = True) -> Dict[str, int]:
+        """Add documents to the collection and return ingest counts.
+
+        With ``upsert`` (the default) each document gets a stable ID from its
+        arXiv ID or URL. Documents whose content hash is unchanged are skipped
+        before any embedding happens, changed ones are re-embedded and
+        overwritten, and only new ones are inserted.
+
+        Content longer than ``ChunkingConfig.CHUNK_TOKENS`` is stored as
+        overlapping chunks that share the document's ``parent_id``; the first
+        chunk keeps the document ID so change detection works per document.
+        """
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
         if not documents:
             logger.warning("No documents provided")
-            return
+            return counts
         try:
-            docs = [
-                Document(
-                    page_content=str(doc.get("content", "")),
-                    metadata={
-                        "source": str(doc.get("url", "")),
-                        "title": str(doc.get("title", "")),
-                        "authors": ", ".join(doc.get("authors", []))  # Convert list to string
-                    }
-                ) for doc in documents if isinstance(doc, dict) and doc.get("content")
-            ]
-            if not docs:
+            valid = [doc for doc in documents if isinstance(doc, dict) and doc.get("content")]
+            if not valid:
                 raise ValueError("No valid documents found")
-            self.vector_store.add_documents(docs)
-            logger.info(f"Added {len(docs)} documents to vector store")
+
+            if upsert:
+                # Last occurrence wins when the same document appears twice in one batch
+                by_id = {self._document_id(doc): doc for doc in valid}
+                ids = list(by_id)
+                valid = list(by_id.values())
+            else:
+                ids = [str(uuid.uuid4()) for _ in valid]
+
+            texts = [str(doc.get("content", "")) for doc in valid]
+            hashes = [self._content_hash(text) for text in texts]
+            metadatas = [self._metadata(doc, content_hash) for doc, content_hash in zip(valid, hashes)]
+
+            existing = self._existing_metadata(ids) if upsert else {}
+            keep = []
+            for i, doc_id in enumerate(ids):
+                if doc_id not in existing:
+                    counts["inserted"] += 1
+                elif self._changed(existing[doc_id], metadatas[i]):
+                    counts["updated"] += 1
+                else:
+                    counts["skipped"] += 1
+                    continue
+                keep.append(i)
+
+            if keep:
+                entry_ids, entry_texts, entry_metadatas, embeddings, stale = [], [], [], [], []
+                for i in keep:
+                    chunks = self.chunker.split(texts[i])
+                    if len(chunks) == 1:
+                        entry_ids.append(ids[i])
+                        entry_texts.append(texts[i])
+                        entry_metadatas.append(metadatas[i])
+                        # Reuse vectors computed upstream (e.g. by SearchAgent); they cover the whole text
+                        embeddings.append(self._precomputed_embedding(valid[i]))
+                    else:
+                        for n, chunk in enumerate(chunks):
+                            entry_ids.append(self._chunk_id(ids[i], n))
+                            entry_texts.append(chunk)
+                            entry_metadatas.append({
+                                **metadatas[i], "parent_id": ids[i], "chunk_index": n, "chunk_count": len(chunks)
+                            })
+                            embeddings.append(None)
+                    # Chunks left over from a longer previous version of the document
+                    previous = int(existing.get(ids[i], {}).get("chunk_count") or 1)
+                    stale.extend(self._chunk_id(ids[i], n) for n in range(len(chunks), previous))
+
+                missing = [j for j, embedding in enumerate(embeddings) if embedding is None]
+                if missing:
+                    fresh = self.embeddings.embed_documents([entry_texts[j] for j in missing])
+                    for j, embedding in zip(missing, fresh):
+                        embeddings[j] = embedding
+
+                self._upsert(entry_ids, embeddings, entry_metadatas, entry_texts)
+                self.lexical_index.upsert(
+                    entry_ids,
+                    [self._lexical_text(metadata, text) for metadata, text in zip(entry_metadatas, entry_texts)]
+                )
+                if stale:
+                    self._delete(stale)
+                    self.lexical_index.delete(stale)
+                self.usage.record_added([ids[i] for i in keep])
+                logger.info(
+                    f"Embedded {len(missing)} of {len(entry_ids)} written chunks for {len(keep)} documents"
+                )
+
+            logger.info(
+                f"Ingested {len(valid)} documents: {counts['inserted']} inserted, "
+                f"{counts['updated']} updated, {counts['skipped']} skipped"
+            )
+            logger.info(f"Embedding cache stats: {self.embeddings.cache.stats()}")
+            return counts
         except Exception as e:
             logger.error(f"Failed to add documents: {str(e)}")
             raise
 
-    def similarity_search(self, query: str, k: int = 10) -> List[Document]:
+    def record_retrieval(self, docs: List[Document]):
+        """Mark returned documents as used, for LRU eviction."""
+        self.usage.record_retrieved([doc.id for doc in docs if doc.id])
+
+    def delete_documents(self, ids: List[str]):
+        """Remove documents, with all their chunks, from every index."""
+        stored = self._existing_metadata(ids)
+        entries = [
+            self._chunk_id(doc_id, n)
+            for doc_id, metadata in stored.items()
+            for n in range(int(metadata.get("chunk_count") or 1))
+        ]
+        if entries:
+            self._delete(entries)
+            self.lexical_index.delete(entries)
+        self.usage.delete(ids)
+        logger.info(f"Deleted {len(stored)} documents ({len(entries)} stored entries)")
+
+    def compact(self) -> Dict[str, int]:
+        """Reclaim space left by deleted and replaced documents.
+
+        Chunks orphaned by a removed or shortened parent are deleted first.
+        The mmap store then rewrites its vector file (rebuilding any ANN
+        index); Chroma is rebuilt into a new collection (see ``_compact_chroma``).
+        """
+        before = self.count_entries()
+        stale = self._orphaned_chunk_ids()
+        if stale:
+            self._delete(stale)
+            self.lexical_index.delete(stale)
+            logger.info(f"Deleted {len(stale)} orphaned chunks")
+        if self.backend == "mmap":
+            self.vector_store.compact()
+        else:
+            self._compact_chroma()
+        self.lexical_index.optimize()
+        return {"entries_before": before, "entries_after": self.count_entries()}
+
+    def export_snapshot(self, path: str, batch_size: int = 5000) -> Dict:
+        """Write every stored entry and its vector to one snapshot file (see
+        ``rag.snapshot``); returns the snapshot header."""
+        return write_snapshot(
+            path, self._iter_entries_with_vectors(batch_size), self.embeddings.model, self.embeddings.dimensions
+        )
+
+    def import_snapshot(self, path: str, batch_size: int = 5000) -> Dict[str, int]:
+        """Bulk-load a snapshot from ``export_snapshot`` without re-embedding.
+
+        The checksum is verified before anything is written. Entries replace
+        stored ones with the same ID, so importing into a live store works
+        like a batch of upserts.
+        """
+        header, batches = read_snapshot(path, batch_size)
+        if header["model"] != self.embeddings.model or header["dimensions"] != self.embeddings.dimensions:
+            raise ValueError(
+                f"Snapshot holds {header['dimensions']}-dim {header['model']} vectors, this store uses "
+                f"{self.embeddings.dimensions}-dim {self.embeddings.model}"
+            )
+        imported = 0
+        for ids, vectors, metadatas, texts in batches:
+            parents = [doc_id for doc_id, metadata in zip(ids, metadatas) if not metadata.get("chunk_index")]
+            existing = self._existing_metadata(parents)
+            self._upsert(ids, vectors, metadatas, texts)
+            self.lexical_index.upsert(ids, [self._lexical_text(metadata, text) for metadata, text in zip(metadatas, texts)])
+            # Chunks left over from a longer stored version of an imported document
+            counts = {doc_id: int(metadata.get("chunk_count") or 1) for doc_id, metadata in zip(ids, metadatas)}
+            stale = [
+                self._chunk_id(doc_id, n)
+                for doc_id, metadata in existing.items()
+                for n in range(counts[doc_id], int(metadata.get("chunk_count") or 1))
+            ]
+            if stale:
+                self._delete(stale)
+                self.lexical_index.delete(stale)
+            self.usage.record_added(parents)
+            imported += len(ids)
+        logger.info(f"Imported {imported} entries from snapshot {path}")
+        return {"imported": imported}
+
+    def _iter_entries_with_vectors(self, batch_size: int = 5000) -> Iterator[Batch]:
+        if self.backend == "mmap":
+            batch = []
+            for doc in self.vector_store.iter_documents(batch_size):
+                batch.append(doc)
+                if len(batch) == batch_size:
+                    yield self._with_vectors(batch)
+                    batch = []
+            if batch:
+                yield self._with_vectors(batch)
+            return
+        offset = 0
+        while True:
+            with self._chroma_session():
+                found = self.vector_store._collection.get(
+                    limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"]
+                )
+            if not found["ids"]:
+                return
+            yield (
+                found["ids"],
+                np.asarray(found["embeddings"], dtype=np.float32),
+                [metadata or {} for metadata in found["metadatas"]],
+                found["documents"]
+            )
+            offset += len(found["ids"])
+
+    def _with_vectors(self, docs: List[Document]) -> Batch:
+        ids, vectors = self.vector_store.get_vectors([doc.id for doc in docs])
+        by_id = {doc.id: doc for doc in docs}
+        metadatas = []
+        for doc_id in ids:
+            metadata = dict(by_id[doc_id].metadata)
+            # The mmap sidecar keeps author tokens in a separate table, not in the metadata
+            if metadata.get("authors"):
+                metadata["author_tokens"] = sorted({author_token(author) for author in metadata["authors"]})
+            metadatas.append(metadata)
+        return ids, vectors, metadatas, [by_id[doc_id].page_content for doc_id in ids]
+
+    def count_entries(self) -> int:
+        """Stored entries, counting each chunk of a chunked document."""
+        if self.backend == "mmap":
+            return self.vector_store.count()
+        with self._chroma_session():
+            return self.vector_store._collection.count()
+
+    def _open_chroma(self, collection_name: Optional[str] = None) -> Chroma:
+        return Chroma(
+            collection_name=collection_name or self._active_collection(),
+            embedding_function=self.embeddings,
+            persist_directory=str(self.persist_dir)
+        )
+
+    def _active_collection(self) -> str:
+        if self._active_file.exists():
+            return self._active_file.read_text(encoding="utf-8").strip() or self.collection_name
+        return self.collection_name
+
+    def _chroma_collection_names(self) -> List[str]:
+        """This store's collections: the original name and any rebuilt ``name.<hex>``."""
+        pattern = re.compile(re.escape(self.collection_name) + r"(\.[0-9a-f]{8})?")
+        names = [getattr(c, "name", c) for c in self.vector_store._client.list_collections()]
+        return [name for name in names if pattern.fullmatch(name)]
+
+    @contextmanager
+    def _chroma_lock(self, name: str, exclusive: bool = False):
+        """Advisory lock shared by every process using this collection.
+
+        ``write`` is held shared by writers and exclusively for a whole
+        compaction; ``read`` is held shared by each Chroma operation and
+        exclusively only while compaction switches collections.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.persist_dir / f".{self.collection_name}.{name}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _chroma_session(self, write: bool = False):
+        """Scope of one Chroma operation: holds the shared locks and first
+        reopens Chroma if another process changed the collection."""
+        if self.backend != "chroma":
+            yield
+            return
+        with self._chroma_lock("write") if write else nullcontext():
+            with self._chroma_lock("read"):
+                self._refresh_chroma()
+                yield
+
+    def _orphaned_chunk_ids(self) -> List[str]:
+        """Chunks whose parent is gone or now has fewer chunks."""
+        chunk_counts, chunks = {}, []
+        for doc in self._iter_stored_documents():
+            if doc.metadata.get("chunk_index"):
+                chunks.append((doc.id, doc.metadata.get("parent_id"), int(doc.metadata["chunk_index"])))
+            else:
+                chunk_counts[doc.id] = int(doc.metadata.get("chunk_count") or 1)
+        return [doc_id for doc_id, parent_id, index in chunks if index >= chunk_counts.get(parent_id, 0)]
+
+    def _compact_chroma(self, batch_size: int = 1000):
+        """Rebuild the collection without the slots of deleted entries.
+
+        Chroma's HNSW segment keeps a slot for every deleted entry, so the
+        live entries are copied into a new collection, the ``.active`` file
+        is switched to it atomically and the old collection is dropped.
+        Writers in other processes wait for the whole rebuild; searches only
+        wait for the switch, then reopen on the marker. Finally the SQLite
+        file is vacuumed and segment directories nothing refers to are removed.
+        """
+        with self._chroma_lock("write", exclusive=True):
+            self._refresh_chroma()
+            client = self.vector_store._client
+            active = self._active_collection()
+            # Copies left by a rebuild interrupted before its switch
+            for name in self._chroma_collection_names():
+                if name != active:
+                    client.delete_collection(name)
+            target_name = f"{self.collection_name}.{uuid.uuid4().hex[:8]}"
+            target = self._open_chroma(target_name)
+            copied = 0
+            for ids, vectors, metadatas, texts in self._iter_entries_with_vectors(batch_size):
+                target._collection.add(
+                    ids=ids, embeddings=vectors, metadatas=[metadata or None for metadata in metadatas],
+                    documents=texts
+                )
+                copied += len(ids)
+            with self._chroma_lock("read", exclusive=True):
+                pending = self._active_file.with_name(self._active_file.name + ".tmp")
+                pending.write_text(target_name, encoding="utf-8")
+                os.replace(pending, self._active_file)
+                client.delete_collection(active)
+                self._reopen_marker.touch()
+                SharedSystemClient.clear_system_cache()
+                self.vector_store = self._open_chroma()
+                self._reopen_stamp = self._marker_stamp()
+                self.revision += 1
+        logger.info(f"Rebuilt Chroma collection {active} as {target_name} with {copied} entries")
+        self._vacuum_chroma()
+
+    def _vacuum_chroma(self):
+        """Vacuum Chroma's SQLite file and remove segment directories no collection refers to."""
+        path = self.persist_dir / "chroma.sqlite3"
+        try:
+            conn = sqlite3.connect(path, timeout=30)
+            try:
+                live_segments = {segment_id for (segment_id,) in conn.execute("SELECT id FROM segments")}
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not vacuum {path}: {str(e)}")
+            return
+        for child in self.persist_dir.iterdir():
+            if child.is_dir() and UUID_PATTERN.fullmatch(child.name) and child.name not in live_segments:
+                shutil.rmtree(child, ignore_errors=True)
+                logger.info(f"Removed orphaned Chroma segment directory {child.name}")
+
+    @staticmethod
+    def _document_id(doc: Dict) -> str:
+        """Stable ID: the arXiv ID (version stripped) when known, else the URL, else the content hash."""
+        url = str(doc.get("url", "") or "")
+        match = ARXIV_ID_PATTERN.search(url)
+        if match:
+            return f"arxiv:{match.group(1)}"
+        if url:
+            return f"url:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+        return f"content:{VectorStoreManager._content_hash(str(doc.get('content', '')))}"
+
+    @staticmethod
+    def _chunk_id(parent_id: str, index: int) -> str:
+        return parent_id if index == 0 else f"{parent_id}#chunk-{index}"
+
+    @staticmethod
+    def _content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _metadata(doc: Dict, content_hash: str) -> Dict:
+        """Stored metadata: display fields plus the indexed fields used by filtered search."""
+        authors = [str(author) for author in doc.get("authors", []) or [] if str(author).strip()]
+        metadata = {
+            "source": str(doc.get("url", "")),
+            "title": str(doc.get("title", "")),
+            "content_hash": content_hash,
+            "source_name": source_name(doc)
+        }
+        # Chroma rejects empty lists, so list fields are only set when non-empty
+        if authors:
+            metadata["authors"] = authors
+            metadata["author_tokens"] = sorted({author_token(author) for author in authors})
+        try:
+            published = published_timestamp(doc.get("published") or doc.get("published_date"))
+        except ValueError:
+            logger.warning(f"Unparseable publication date for {metadata['title']}: {doc.get('published')}")
+            published = None
+        if published is not None:
+            metadata["published"] = published
+        return metadata
+
+    @staticmethod
+    def _changed(stored: Dict, metadata: Dict) -> bool:
+        if stored.get("content_hash", "") != metadata["content_hash"]:
+            return True
+        return any(
+            (stored.get(field) or None) != (metadata.get(field) or None)
+            for field in FILTER_METADATA_FIELDS
+        )
+
+    def _existing_metadata(self, ids: List[str]) -> Dict[str, Dict]:
+        if self.backend == "mmap":
+            return self.vector_store.get_metadata(ids)
+        with self._chroma_session():
+            found = self.vector_store._collection.get(ids=ids, include=["metadatas"])
+        return {doc_id: metadata or {} for doc_id, metadata in zip(found["ids"], found["metadatas"])}
+
+    def _upsert(self, ids: List[str], embeddings: List[List[float]], metadatas: List[Dict], texts: List[str]):
+        self.revision += 1
+        if self.backend == "mmap":
+            self.vector_store.upsert(ids, embeddings, metadatas, texts)
+        else:
+            with self._chroma_session(write=True):
+                self.vector_store._collection.upsert(
+                    ids=ids, embeddings=embeddings, metadatas=metadatas, documents=texts
+                )
+
+    def _delete(self, ids: List[str]):
+        self.revision += 1
+        if self.backend == "mmap":
+            self.vector_store.delete(ids)
+        else:
+            with self._chroma_session(write=True):
+                self.vector_store._collection.delete(ids=ids)
+                self._reopen_marker.touch()
+                self._reopen_stamp = self._marker_stamp()
+
+    def _marker_stamp(self) -> Optional[int]:
+        return self._reopen_marker.stat().st_mtime_ns if self._reopen_marker.exists() else None
+
+    def _refresh_chroma(self):
+        """Reopen Chroma after another process (e.g. python -m rag.maintenance)
+        deleted entries or switched to a rebuilt collection: the HNSW index is
+        loaded once per process and would keep returning the deleted IDs."""
+        if self.backend != "chroma":
+            return
+        stamp = self._marker_stamp()
+        if stamp == self._reopen_stamp:
+            return
+        SharedSystemClient.clear_system_cache()
+        self.vector_store = self._open_chroma()
+        self._reopen_stamp = stamp
+        self.revision += 1
+        logger.info(f"Reopened Chroma collection {self._active_collection()} after changes by another process")
+
+    def _get_documents(self, ids: List[str]) -> List[Document]:
+        """Stored documents for ``ids``, in that order."""
+        if not ids:
+            return []
+        if self.backend == "mmap":
+            return self.vector_store.get_documents(ids)
+        with self._chroma_session():
+            found = self.vector_store._collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            doc_id: Document(page_content=text, metadata=metadata or {}, id=doc_id)
+            for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def _iter_stored_documents(self, batch_size: int = 1000) -> Iterator[Document]:
+        if self.backend == "mmap":
+            yield from self.vector_store.iter_documents(batch_size)
+            return
+        offset = 0
+        while True:
+            with self._chroma_session():
+                batch = self.vector_store._collection.get(
+                    limit=batch_size, offset=offset, include=["documents", "metadatas"]
+                )
+            if not batch["ids"]:
+                return
+            for doc_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                yield Document(page_content=text, metadata=metadata or {}, id=doc_id)
+            offset += len(batch["ids"])
+
+    def _backfill_lexical_index(self, batch_size: int = 1000):
+        """Index documents stored before the lexical index existed."""
+        batch = []
+        total = 0
+        for doc in self._iter_stored_documents(batch_size):
+            batch.append(doc)
+            if len(batch) == batch_size:
+                total += self._index_lexical(batch)
+                batch = []
+        total += self._index_lexical(batch)
+        if total:
+            logger.info(f"Backfilled lexical index with {total} documents")
+
+    def _index_lexical(self, docs: List[Document]) -> int:
+        self.lexical_index.upsert(
+            [doc.id for doc in docs],
+            [self._lexical_text(doc.metadata, doc.page_content) for doc in docs]
+        )
+        return len(docs)
+
+    @staticmethod
+    def _lexical_text(metadata: Dict, text: str) -> str:
+        return f"{metadata.get('title', '')}\n{text}"
+
+    def _precomputed_embedding(self, doc: Dict) -> Optional[List[float]]:
+        embedding = doc.get("embedding")
+        if (
+            embedding is not None
+            and len(embedding) == self.embeddings.dimensions
+            and doc.get("embedding_model", self.embeddings.model) == self.embeddings.model
+        ):
+            return list(embedding)
+        return None
+
+    def similarity_search(self, query: str, k: int = 10, filters: Optional[Dict] = None) -> List[Document]:
+        """Nearest documents to ``query``, optionally restricted by ``filters``.
+
+        ``filters`` may set ``published_from`` / ``published_to`` (dates, ISO
+        strings or years, inclusive), ``authors`` and ``sources`` (any of).
+        Predicates are evaluated by the store's metadata index before scoring,
+        so filtered queries still return up to ``k`` matches. Chunk hits are
+        collapsed into one result per parent document.
+        """
         if not query or not isinstance(query, str):
             raise ValueError("Invalid query")
+        filters = normalize_filters(filters)
         try:
-            results = self.vector_store.similarity_search(query, k=k)
+            if self.backend == "mmap":
+                query_vector = self.embeddings.embed_query(query)
+                hits = [doc for doc, _ in self.vector_store.search(query_vector, k=self._fetch_k(k), filters=filters)]
+            else:
+                with self._chroma_session():
+                    hits = self.vector_store.similarity_search(query, k=self._fetch_k(k), filter=to_chroma_where(filters))
+            results = self._collapse_chunks(hits, k)
             logger.info(f"Retrieved {len(results)} results for query: {query}")
             return results
         except Exception as e:
             logger.error(f"Search failed for query {query}: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    def lexical_search(self, query: str, k: int = 10, filters: Optional[Dict] = None) -> List[Document]:
+        """BM25 keyword search over the stored documents.
+
+        The lexical index holds no metadata, so ``filters`` are applied to an
+        over-fetched candidate list.
+        """
+        if not query or not isinstance(query, str):
+            raise ValueError("Invalid query")
+        filters = normalize_filters(filters)
+        try:
+            hits = self.lexical_index.search(query, self._fetch_k(k) * (5 if filters else 1))
+            results = self._get_documents([doc_id for doc_id, _ in hits])
+            results = self._collapse_chunks([doc for doc in results if matches_filters(doc.metadata, filters)], k)
+            logger.info(f"Lexical search returned {len(results)} results for query: {query}")
+            return results
+        except Exception as e:
+            logger.error(f"Lexical search failed for query {query}: {str(e)}")
+            return []
+
+    def similarity_search_batch(self, queries: List[str], k: int = 10,
+                                filters: Optional[Dict] = None) -> Dict[str, List]:
+        """Search several queries at once with one embedding request and one index probe.
+
+        Returns ``per_query`` (a result list per query, in order) and ``fused``
+        (every result once, ranked by reciprocal rank fusion across queries).
+        ``filters`` apply to every query, as in ``similarity_search``.
+        """
+        if not queries or not all(query and isinstance(query, str) for query in queries):
+            raise ValueError("Invalid queries")
+        filters = normalize_filters(filters)
+        per_query = [[] for _ in queries]
+        try:
+            matrix = self.embeddings.embed_matrix(queries)
+            embedded = np.flatnonzero(~np.isnan(matrix[:, 0]))
+            if len(embedded):
+                if self.backend == "mmap":
+                    found = [
+                        [doc for doc, _ in hits]
+                        for hits in self.vector_store.search_batch(matrix[embedded], self._fetch_k(k), filters)
+                    ]
+                else:
+                    with self._chroma_session():
+                        found = self._chroma_query_batch(matrix[embedded], self._fetch_k(k), filters)
+                for i, docs in zip(embedded, found):
+                    per_query[i] = self._collapse_chunks(docs, k)
+            fused = reciprocal_rank_fusion(per_query, k=RetrievalConfig.RRF_K)
+            logger.info(f"Batch search for {len(queries)} queries returned {len(fused)} unique results")
+            return {"per_query": per_query, "fused": fused}
+        except Exception as e:
+            logger.error(f"Batch search failed for queries {queries}: {str(e)}")
+            return {"per_query": per_query, "fused": []}
+
+    def similarity_search_with_vectors(self, query: str, k: int = 10,
+                                       filters: Optional[Dict] = None) -> Tuple[np.ndarray, List[Document], np.ndarray]:
+        """``similarity_search`` that also returns the query vector and the
+        stored vector of each result (its best chunk's for chunked documents),
+        read from the store rather than re-embedded."""
+        if not query or not isinstance(query, str):
+            raise ValueError("Invalid query")
+        filters = normalize_filters(filters)
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        if self.backend == "mmap":
+            hits = [doc for doc, _ in self.vector_store.search(query_vector, k=self._fetch_k(k), filters=filters)]
+            found, vectors = self.vector_store.get_vectors([doc.id for doc in hits])
+            by_id = {doc.id: doc for doc in hits}
+            hits = [by_id[doc_id] for doc_id in found]
+        else:
+            with self._chroma_session():
+                result = self.vector_store._collection.query(
+                    query_embeddings=[query_vector.tolist()], n_results=self._fetch_k(k),
+                    where=to_chroma_where(filters), include=["documents", "metadatas", "embeddings"]
+                )
+            hits = [
+                Document(page_content=text, metadata=metadata or {}, id=doc_id)
+                for doc_id, text, metadata in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])
+            ]
+            vectors = np.asarray(result["embeddings"][0], dtype=np.float32).reshape(-1, len(query_vector))
+        results = self._collapse_chunks(hits, k)
+        # Hits are best first, so each parent's first hit is its best chunk
+        first_hit = {}
+        for i, doc in enumerate(hits):
+            first_hit.setdefault(doc.metadata.get("parent_id") or doc.id, i)
+        logger.info(f"Retrieved {len(results)} results with vectors for query: {query}")
+        return query_vector, results, vectors[[first_hit[doc.id] for doc in results]]
+
+    def _chroma_query_batch(self, matrix: np.ndarray, k: int, filters: Optional[Dict] = None) -> List[List[Document]]:
+        result = self.vector_store._collection.query(
+            query_embeddings=matrix.tolist(), n_results=k, where=to_chroma_where(filters),
+            include=["documents", "metadatas"]
+        )
+        return [
+            [
+                Document(page_content=text, metadata=metadata or {}, id=doc_id)
+                for doc_id, text, metadata in zip(ids, texts, metadatas)
+            ]
+            for ids, texts, metadatas in zip(result["ids"], result["documents"], result["metadatas"])
+        ]
+
+    @staticmethod
+    def _fetch_k(k: int) -> int:
+        """Candidates to fetch so ``k`` distinct documents remain after collapsing chunks."""
+        return k * ChunkingConfig.OVERFETCH
+
+    def _collapse_chunks(self, hits: List[Document], k: int) -> List[Document]:
+        """One result per parent document, in order of its best-ranked chunk."""
+        groups: Dict[str, List[Document]] = {}
+        for doc in hits:
+            groups.setdefault(doc.metadata.get("parent_id") or doc.id, []).append(doc)
+        results = []
+        for parent_id, chunks in list(groups.items())[:k]:
+            if "parent_id" in chunks[0].metadata:
+                results.append(self._parent_excerpt(parent_id, chunks))
+            else:
+                results.append(chunks[0])
+        return results
+
+    @staticmethod
+    def _parent_excerpt(parent_id: str, chunks: List[Document]) -> Document:
+        """Parent document whose content is its matched chunks, best first, within
+        ``ChunkingConfig.EXCERPT_TOKENS`` and then put back in document order."""
+        budget = ChunkingConfig.EXCERPT_TOKENS
+        selected = []
+        for chunk in chunks:
+            tokens = count_tokens(chunk.page_content)
+            if tokens <= budget:
+                selected.append((chunk.metadata.get("chunk_index", 0), chunk.page_content))
+                budget -= tokens
+            elif not selected:
+                selected.append((chunk.metadata.get("chunk_index", 0), truncate_tokens(chunk.page_content, budget)))
+                break
+        selected.sort()
+        metadata = {
+            key: value for key, value in chunks[0].metadata.items() if key not in ("parent_id", "chunk_index")
+        }
+        metadata["matched_chunks"] = [index for index, _ in selected]
+        return Document(
+            page_content=" … ".join(text for _, text in selected), metadata=metadata, id=parent_id
+        )
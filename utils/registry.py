@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+import httpx
+from openai import AsyncAzureOpenAI, AzureOpenAI
+
+from config import AzureConfig, ClientConfig, ResilienceConfig, VectorStoreConfig
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_instances: Dict[Hashable, Any] = {}
+# Re-entrant: factories fetch other shared resources (a client needs the HTTP pool)
+_lock = threading.RLock()
+
+
+def shared(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """Process-wide instance for ``key``, created by ``factory`` on first use."""
+    with _lock:
+        if key not in _instances:
+            _instances[key] = factory()
+            logger.info(f"Created shared resource {key}")
+        return _instances[key]
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=ClientConfig.MAX_CONNECTIONS,
+        max_keepalive_connections=ClientConfig.MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=ClientConfig.KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """Pooled HTTP client behind every sync Azure OpenAI call, so agents reuse warm connections."""
+    return shared("http", lambda: httpx.Client(limits=_limits(), timeout=ResilienceConfig.REQUEST_TIMEOUT_SECONDS))
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    return shared(
+        "http-async", lambda: httpx.AsyncClient(limits=_limits(), timeout=ResilienceConfig.REQUEST_TIMEOUT_SECONDS)
+    )
+
+
+def get_openai_client() -> AzureOpenAI:
+    """Azure OpenAI client shared by the agents and the embeddings provider.
+
+    SDK retries are off; ``utils.resilience`` retries under a shared budget.
+    """
+    return shared("azure-openai", lambda: AzureOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=AzureConfig.API_VERSION,
+        timeout=ResilienceConfig.REQUEST_TIMEOUT_SECONDS,
+        max_retries=0,
+        http_client=get_http_client()
+    ))
+
+
+def get_async_openai_client() -> AsyncAzureOpenAI:
+    return shared("azure-openai-async", lambda: AsyncAzureOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=AzureConfig.API_VERSION,
+        timeout=ResilienceConfig.REQUEST_TIMEOUT_SECONDS,
+        max_retries=0,
+        http_client=get_async_http_client()
+    ))
+
+
+def get_chat_model(model: str = "gpt-4-turbo", temperature: float = 0.3):
+    """LangChain chat model on the shared connection pools; retries go through ``utils.resilience``."""
+    from langchain_openai import AzureChatOpenAI
+
+    return shared(("chat-model", model, temperature), lambda: AzureChatOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+        api_version=AzureConfig.API_VERSION,
+        model=model,
+        temperature=temperature,
+        max_retries=0,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client()
+    ))
+
+
+def get_arxiv_client():
+    """arXiv API client; shared so its request pacing applies process-wide."""
+    from arxiv import Client
+
+    return shared("arxiv", Client)
+
+
+def get_vector_store(persist_dir: str = VectorStoreConfig.PERSIST_DIR,
+                     backend: str = VectorStoreConfig.BACKEND):
+    """One ``VectorStoreManager`` per store, so Chroma, the mmap sidecar and
+    the lexical index are opened once per process."""
+    from rag.vector_store import VectorStoreManager
+
+    return shared(
+        ("vector-store", os.path.abspath(persist_dir), backend),
+        lambda: VectorStoreManager(persist_dir=persist_dir, backend=backend)
+    )
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from config import ResilienceConfig
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Client errors that will fail the same way on retry and say nothing about backend health
+NON_RETRYABLE_STATUS = {400, 401, 403, 404, 422}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the backend while an endpoint's circuit is open."""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuit for '{endpoint}' is open; retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: closed -> open after consecutive failures,
+    half-open after ``reset_timeout`` to let a single trial call through."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, endpoint: str,
+                 failure_threshold: int = ResilienceConfig.FAILURE_THRESHOLD,
+                 reset_timeout: float = ResilienceConfig.RESET_TIMEOUT_SECONDS):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self):
+        """Raise ``CircuitOpenError`` unless a call may go out now."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_in = max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+            raise CircuitOpenError(self.endpoint, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit for '{self.endpoint}' closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Free the half-open trial slot without judging the backend, e.g.
+        when the trial call was cancelled."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != self.OPEN:
+                    logger.warning(f"Circuit for '{self.endpoint}' opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_in": (
+                    max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+                    if state == self.OPEN else 0.0
+                )
+            }
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+
+class RetryBudget:
+    """Process-wide cap on retries: at most ``ratio`` of recent calls (and
+    never fewer than ``min_retries``) within a sliding window may be retries,
+    so a degraded backend cannot multiply load with retry storms."""
+
+    def __init__(self, ratio: float = ResilienceConfig.RETRY_BUDGET_RATIO,
+                 min_retries: int = ResilienceConfig.RETRY_BUDGET_MIN,
+                 window: float = ResilienceConfig.RETRY_BUDGET_WINDOW_SECONDS):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._calls = deque()
+        self._retries = deque()
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self._calls.append(time.monotonic())
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            for events in (self._calls, self._retries):
+                while events and now - events[0] > self.window:
+                    events.popleft()
+            if len(self._retries) >= max(self.min_retries, self.ratio * len(self._calls)):
+                return False
+            self._retries.append(now)
+            return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls_in_window": len(self._calls), "retries_in_window": len(self._retries)}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+retry_budget = RetryBudget()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+def circuit_states() -> Dict[str, Any]:
+    """Current breaker state per endpoint plus retry budget usage."""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {
+        "circuits": {endpoint: breaker.snapshot() for endpoint, breaker in breakers.items()},
+        "retry_budget": retry_budget.snapshot()
+    }
+
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    return status not in NON_RETRYABLE_STATUS
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    cap = min(ResilienceConfig.BACKOFF_MAX_SECONDS, ResilienceConfig.BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def call(endpoint: str, fn: Callable, *args, max_retries: Optional[int] = None, **kwargs):
+    """Run ``fn`` behind ``endpoint``'s circuit breaker with jittered retries
+    drawn from the global retry budget. Fails fast while the circuit is open."""
+    breaker = get_breaker(endpoint)
+    max_retries = ResilienceConfig.MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        breaker.allow()
+        retry_budget.record_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.record_success()  # The backend answered; the request was bad
+                raise
+            breaker.record_failure()
+            if attempt >= max_retries or not retry_budget.try_spend():
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"Call to '{endpoint}' failed ({str(e)}), retry {attempt + 1} in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            # Cancelled or interrupted: no verdict on the backend, but free a half-open trial
+            breaker.release_trial()
+            raise
+        breaker.record_success()
+        return result
+
+
+async def acall(endpoint: str, fn: Callable, *args, max_retries: Optional[int] = None, **kwargs):
+    """Async ``call`` for coroutine functions."""
+    breaker = get_breaker(endpoint)
+    max_retries = ResilienceConfig.MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        breaker.allow()
+        retry_budget.record_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt >= max_retries or not retry_budget.try_spend():
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"Call to '{endpoint}' failed ({str(e)}), retry {attempt + 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        except BaseException:
+            # Cancelled or interrupted: no verdict on the backend, but free a half-open trial
+            breaker.release_trial()
+            raise
+        breaker.record_success()
+        return result